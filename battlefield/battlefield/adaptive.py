@@ -0,0 +1,144 @@
+import heapq
+import itertools
+import numpy as np
+
+from battlefield.avalon import AvalonState
+from battlefield.tournament import tournament_matchings, large_tournament_batch_helper, imap_unordered_bounded, results_to_dataframe, GAMES_PER_BATCH
+
+Z_95 = 1.96
+# How many games' worth of the pooled variance each cell's own variance estimate is shrunk towards, so a cell
+# whose first few games happened to agree still gets more games
+PRIOR_WEIGHT = 2.0
+
+
+class MatchingStats(object):
+    """
+    Running mean and sum of squared deviations (Welford) of each bot's average payoff over the games of one
+    matching (hidden state, bot order)
+    """
+    def __init__(self, num_bots):
+        self.n = 0
+        self.mean = np.zeros(num_bots)
+        self.m2 = np.zeros(num_bots)
+
+
+    def add(self, x):
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+
+
+def bot_payoffs(game_stat, bot_names):
+    """
+    The average payoff of the seats each bot played in one game
+    """
+    payoffs = np.zeros(len(bot_names))
+    counts = np.zeros(len(bot_names))
+    player = 0
+    while 'bot_{}'.format(player) in game_stat:
+        k = bot_names.index(game_stat['bot_{}'.format(player)])
+        payoffs[k] += game_stat['bot_{}_payoff'.format(player)]
+        counts[k] += 1
+        player += 1
+    return payoffs / counts
+
+
+def matching_variances(stats):
+    """
+    (num_matchings, num_bots) per-game payoff variances, each shrunk towards the variance pooled over matchings
+    """
+    n = np.array([ s.n for s in stats ], dtype=np.float64)
+    m2 = np.array([ s.m2 for s in stats ])
+    pooled = np.sum(m2, axis=0) / max(np.sum(n - 1), 1.0)
+    return (m2 + PRIOR_WEIGHT * pooled) / (n - 1 + PRIOR_WEIGHT)[:, np.newaxis]
+
+
+def estimate(stats, z=Z_95):
+    """
+    The stratified estimate of each bot's payoff, weighting every matching equally like run_large_tournament
+    does, and the half width of its confidence interval
+    """
+    n = np.array([ s.n for s in stats ], dtype=np.float64)
+    means = np.mean([ s.mean for s in stats ], axis=0)
+    variance_of_mean = np.sum(matching_variances(stats) / n[:, np.newaxis], axis=0) / len(stats)**2
+    return means, z * np.sqrt(variance_of_mean)
+
+
+def allocate_games(stats, bot, num_games, max_games_per_matching):
+    """
+    Hands out num_games to the matchings which most shrink the variance of bot's estimate: a game in a
+    matching with variance v and n games removes v / (n (n + 1)). Returns a list of games per matching.
+    """
+    variances = matching_variances(stats)[:, bot]
+    allocation = [0] * len(stats)
+    heap = [ (-variances[i] / (s.n * (s.n + 1)), i) for i, s in enumerate(stats) if s.n < max_games_per_matching ]
+    heapq.heapify(heap)
+    for _ in range(num_games):
+        if len(heap) == 0:
+            break
+        _, i = heapq.heappop(heap)
+        allocation[i] += 1
+        n = stats[i].n + allocation[i]
+        if n < max_games_per_matching:
+            heapq.heappush(heap, (-variances[i] / (n * (n + 1)), i))
+    return allocation
+
+
+def matching_tasks(matchings, allocation, start_state, record):
+    for i, num_games in enumerate(allocation):
+        hidden_state, bot_order, _, beliefs = matchings[i]
+        for first_game in range(0, num_games, GAMES_PER_BATCH):
+            batch_size = min(GAMES_PER_BATCH, num_games - first_game)
+            yield (i, [(bot_order, hidden_state, beliefs, start_state, record)] * batch_size)
+
+
+def run_adaptive_tournament(bots_classes, roles, pool=None, target_half_width=0.05, min_games_per_matching=4, max_games_per_matching=50, round_fraction=0.25, z=Z_95, recorder=None):
+    """
+    Like run_large_tournament, but instead of a fixed number of games per matching, games go to the matchings
+    whose payoffs vary most, and play stops once every bot's payoff confidence interval is narrower than
+    +/- target_half_width (or every matching has max_games_per_matching games).
+
+    Games are played in rounds of round_fraction of the games so far, on pool if given. Returns the games as a
+    DataFrame with a 'weight' column (weighted sums give the equal-per-matching averages), and a dict of
+    bot name -> (payoff, half width).
+    """
+    print "Running adaptive {}".format(' '.join(map(lambda c: c.__name__, bots_classes)))
+    assert min_games_per_matching >= 2, "Need two games per matching to estimate its variance"
+
+    bot_names = sorted(set(bot_cls.__name__ for bot_cls in bots_classes))
+    matchings = list(tournament_matchings(bots_classes, roles))
+    stats = [ MatchingStats(len(bot_names)) for _ in matchings ]
+    start_state = AvalonState.start_state(len(roles))
+
+    result = []
+    result_matchings = []
+    allocation = [min_games_per_matching] * len(matchings)
+    while True:
+        tasks = matching_tasks(matchings, allocation, start_state, recorder is not None)
+        if pool is None:
+            batches = itertools.imap(lambda args: large_tournament_batch_helper(*args), tasks)
+        else:
+            batches = imap_unordered_bounded(pool, large_tournament_batch_helper, tasks)
+        for i, batch, _ in batches:
+            for game_stat, trajectories, _ in batch:
+                stats[i].add(bot_payoffs(game_stat, bot_names))
+                result.append(game_stat)
+                result_matchings.append(i)
+                if recorder is not None:
+                    recorder.extend(trajectories)
+
+        means, half_widths = estimate(stats, z=z)
+        widest = np.argmax(half_widths)
+        print "{} games, widest interval {} {:.3f} +/- {:.3f}".format(len(result), bot_names[widest], means[widest], half_widths[widest])
+        if half_widths[widest] <= target_half_width:
+            break
+        round_games = max(int(len(result) * round_fraction), GAMES_PER_BATCH)
+        allocation = allocate_games(stats, widest, round_games, max_games_per_matching)
+        if sum(allocation) == 0:
+            break
+
+    df = results_to_dataframe(result, len(roles))
+    games_per_matching = np.array([ s.n for s in stats ], dtype=np.float64)
+    df['weight'] = 1.0 / (len(matchings) * games_per_matching[result_matchings])
+    return df, { name: (means[k], half_widths[k]) for k, name in enumerate(bot_names) }
@@ -1,13 +1,63 @@
-import itertools
-
 from game import GameState
-from battlefield.avalon_types import AVALON_PROPOSE_SIZES, AVALON_PLAYER_COUNT, EVIL_ROLES, GOOD_ROLES, ProposeAction, VoteAction, MissionAction, PickMerlinAction
+from battlefield.zobrist import state_hash
+from battlefield.avalon_types import AVALON_PROPOSE_SIZES, AVALON_PLAYER_COUNT, EVIL_ROLES, GOOD_ROLES, LEGAL_ACTIONS, ProposeAction, VoteAction, MissionAction, PickMerlinAction
+
+STATUSES = frozenset(['propose', 'vote', 'run', 'merlin', 'end'])
+
+# Every state reachable through transition() is interned here, keyed on
+# (num_players, proposer, propose_count, succeeds, fails, status, proposal, game_end).
+INTERNED_STATES = {}
+
+# Per player count, the successors which don't depend on the proposal, keyed on
+# (proposer, propose_count, succeeds, fails, status, edge).
+TRANSITION_TABLES = {}
+
+
+def get_state(num_players, proposer, propose_count, succeeds, fails, status, proposal, game_end):
+    """
+    Returns the interned state with these fields, creating (and validating) it the first time it's seen
+    """
+    key = (num_players, proposer, propose_count, succeeds, fails, status, proposal, game_end)
+    state = INTERNED_STATES.get(key)
+    if state is None:
+        state = INTERNED_STATES[key] = AvalonState(proposer, propose_count, succeeds, fails, status, proposal, game_end, num_players)
+    return state
+
+
+def build_transition_table(num_players):
+    """
+    Precomputes every proposal-independent transition for a player count
+    """
+    if num_players in TRANSITION_TABLES:
+        return TRANSITION_TABLES[num_players]
+
+    table = {}
+    for succeeds in range(3):
+        for fails in range(3):
+            for proposer in range(num_players):
+                for propose_count in range(5):
+                    state = get_state(num_players, proposer, propose_count, succeeds, fails, 'propose', None, None)
+                    key = (proposer, propose_count, succeeds, fails)
+                    table[key + ('vote', 'fail')] = state.vote_fail_transition()
+                    table[key + ('run', 'fail')] = state.mission_fail_transition()
+                    table[key + ('run', 'succeed')] = state.mission_succeed_transition()
+
+    for fails in range(3):
+        merlin_state = get_state(num_players, 0, 0, 3, fails, 'merlin', None, None)
+        key = (0, 0, 3, fails)
+        table[key + ('merlin', True)] = merlin_state.pick_merlin_transition(None, True)[0]
+        table[key + ('merlin', False)] = merlin_state.pick_merlin_transition(None, False)[0]
+
+    TRANSITION_TABLES[num_players] = table
+    return table
+
 
 class AvalonState(GameState):
-    NUM_PLAYERS = None
-    NUM_GOOD = None
-    NUM_EVIL = None
-    MISSION_SIZES = None
+    __slots__ = [
+        'NUM_PLAYERS', 'NUM_GOOD', 'NUM_EVIL', 'MISSION_SIZES',
+        'proposer', 'propose_count', 'succeeds', 'fails', 'status', 'proposal', 'game_end',
+        'zobrist', '_key', '_successors'
+    ]
 
     def __init__(self, proposer, propose_count, succeeds, fails, status, proposal, game_end, num_players):
         self.NUM_PLAYERS = num_players
@@ -18,7 +68,7 @@ class AvalonState(GameState):
         assert 0 <= succeeds <= 3, "succeeds invalid"
         assert 0 <= fails <= 3, "fails invalid"
         assert 0 <= succeeds + fails <= 5, "Round invalid"
-        assert status in set(['propose', 'vote', 'run', 'merlin', 'end']), "invalid status"
+        assert status in STATUSES, "invalid status"
         assert status != 'end' or game_end is not None, "game end not consistent"
         assert status != 'merlin' or succeeds == 3, "merlin guess not consistent"
         assert status != 'run' or proposal is not None, "bad proposal for running"
@@ -31,10 +81,18 @@ class AvalonState(GameState):
         self.status = status
         self.proposal = proposal
         self.game_end = game_end
+        self._key = (proposer, propose_count, succeeds, fails, status, proposal, game_end)
+        self.zobrist = state_hash((num_players,) + self._key)
+        self._successors = {}
+
+
+    def __reduce__(self):
+        # Re-intern on unpickle, so states sent to worker processes still hit the transition tables
+        return (get_state, (self.NUM_PLAYERS,) + self._key)
 
 
     def as_key(self):
-        return (self.proposer, self.propose_count, self.succeeds, self.fails, self.status, self.proposal, self.game_end)
+        return self._key
 
 
     @classmethod
@@ -42,12 +100,12 @@ class AvalonState(GameState):
         """
         Returns the starting state for a certain number of players
         """
-        return cls(proposer=0, propose_count=0, succeeds=0, fails=0, status='propose', proposal=None, game_end=None, num_players=num_players)
+        build_transition_table(num_players)
+        return get_state(num_players, 0, 0, 0, 0, 'propose', None, None)
 
 
-    def new(self, *args, **kwargs):
-        kwargs['num_players'] = self.NUM_PLAYERS
-        return self.__class__(*args, **kwargs)
+    def new(self, proposer, propose_count, succeeds, fails, status, proposal, game_end):
+        return get_state(self.NUM_PLAYERS, proposer, propose_count, succeeds, fails, status, proposal, game_end)
 
 
     def is_terminal(self):
@@ -102,24 +160,17 @@ class AvalonState(GameState):
         Returns the legal actions of the player from this state, given a hidden state
         """
         assert player in self.moving_players(), "Asked a non-moving player legal actions"
-        if self.status == 'merlin':
-            return [PickMerlinAction(merlin=p) for p in range(self.NUM_PLAYERS)]
-
-        if self.status == 'propose':
-            proposal_size, _ = self.MISSION_SIZES[self.succeeds + self.fails]
-            return [ProposeAction(proposal=p) for p in itertools.combinations(range(self.NUM_PLAYERS), r=proposal_size)]
+        return self.legal_actions_unchecked(player, hidden_state)
 
-        if self.status == 'vote':
-            return [VoteAction(up=True), VoteAction(up=False)]
 
-        if self.status == 'run':
-            player_role = hidden_state[player]
-            if player_role in EVIL_ROLES:
-                return [MissionAction(fail=False), MissionAction(fail=True)]
-            else:
-                return [MissionAction(fail=False)]
-
-        assert False, "Not sure how we got here"
+    def legal_actions_unchecked(self, player, hidden_state):
+        """
+        Same as legal_actions, but trusts that the state isn't terminal and that player is one of its moving
+        players (otherwise this returns another player's actions, or raises KeyError). The result is shared
+        between calls, so don't modify it. For search code only.
+        """
+        is_evil = self.status == 'run' and hidden_state[player] in EVIL_ROLES
+        return LEGAL_ACTIONS[(self.NUM_PLAYERS, self.succeeds + self.fails, self.status, is_evil)]
 
 
     def vote_fail_transition(self):
@@ -162,9 +213,12 @@ class AvalonState(GameState):
     def vote_transition(self, hidden_state, votes):
         up_votes = sum([ 1 for vote in votes if vote.up ])
         if up_votes > self.NUM_PLAYERS/2:
-            return self.vote_pass_transition(), hidden_state, tuple(votes)
+            new_state = self._successors.get('vote_pass')
+            if new_state is None:
+                new_state = self._successors['vote_pass'] = self.vote_pass_transition()
         else:
-            return self.vote_fail_transition(), hidden_state, tuple(votes)
+            new_state = self.lookup_transition('vote', 'fail') or self.vote_fail_transition()
+        return new_state, hidden_state, tuple(votes)
 
 
     def mission_fail_transition(self):
@@ -217,21 +271,25 @@ class AvalonState(GameState):
         _, num_fails_required = self.MISSION_SIZES[self.succeeds + self.fails]
         actual_fails = sum([ 1 for mission_vote in mission_votes if mission_vote.fail ])
         if actual_fails >= num_fails_required:
-            return self.mission_fail_transition(), hidden_state, actual_fails
+            new_state = self.lookup_transition('run', 'fail') or self.mission_fail_transition()
         else:
-            return self.mission_succeed_transition(), hidden_state, actual_fails
+            new_state = self.lookup_transition('run', 'succeed') or self.mission_succeed_transition()
+        return new_state, hidden_state, actual_fails
 
 
     def proposal_transition(self, hidden_state, proposal):
-        return self.new(
-            proposer=self.proposer,
-            propose_count=self.propose_count,
-            succeeds=self.succeeds,
-            fails=self.fails,
-            status='vote',
-            proposal=proposal,
-            game_end=None
-        ), hidden_state, proposal
+        new_state = self._successors.get(proposal)
+        if new_state is None:
+            new_state = self._successors[proposal] = self.new(
+                proposer=self.proposer,
+                propose_count=self.propose_count,
+                succeeds=self.succeeds,
+                fails=self.fails,
+                status='vote',
+                proposal=proposal,
+                game_end=None
+            )
+        return new_state, hidden_state, proposal
 
 
     def pick_merlin_transition(self, hidden_state, assassin_picked_correctly):
@@ -246,6 +304,14 @@ class AvalonState(GameState):
         ), hidden_state, assassin_picked_correctly
 
 
+    def lookup_transition(self, status, edge):
+        """
+        Returns the successor along a proposal-independent edge from the transition table, or None if it isn't there
+        """
+        table = TRANSITION_TABLES.get(self.NUM_PLAYERS) or build_transition_table(self.NUM_PLAYERS)
+        return table.get((self.proposer, self.propose_count, self.succeeds, self.fails, status, edge))
+
+
     def transition(self, moves, hidden_state):
         """
         Returns a tuple:
@@ -256,11 +322,20 @@ class AvalonState(GameState):
         assert len(moves) == len(self.moving_players()), "More players moved than allowed"
         # for player, move in zip(self.moving_players(), moves):
         #     assert move in self.legal_actions(player, hidden_state), '{}, {}, {}, {}'.format(move, self, player, hidden_state)
+        return self.transition_unchecked(moves, hidden_state)
 
+
+    def transition_unchecked(self, moves, hidden_state):
+        """
+        Same as transition, but trusts that moves came from the moving players. For search code only.
+        """
         if self.status == 'merlin':
             chosen_player = moves[hidden_state.index('assassin')].merlin
             assassin_picked_correctly = chosen_player == hidden_state.index('merlin')
-            return self.pick_merlin_transition(hidden_state, assassin_picked_correctly)
+            new_state = self.lookup_transition('merlin', assassin_picked_correctly)
+            if new_state is None:
+                return self.pick_merlin_transition(hidden_state, assassin_picked_correctly)
+            return new_state, hidden_state, assassin_picked_correctly
 
         if self.status == 'propose':
             proposal = moves[0].proposal
@@ -276,7 +351,19 @@ class AvalonState(GameState):
 
 
     def __repr__(self):
-        return "<AvalonState " + " ".join("{}={}".format(*kv) for kv in sorted(self.__dict__.items())) + ">"
+        fields = ['MISSION_SIZES', 'NUM_EVIL', 'NUM_GOOD', 'NUM_PLAYERS', 'fails', 'game_end', 'proposal', 'propose_count', 'proposer', 'status', 'succeeds']
+        return "<AvalonState " + " ".join("{}={}".format(field, getattr(self, field)) for field in fields) + ">"
+
+
+def rollout(state, hidden_state, policy_fn):
+    """
+    Plays the game out from state, with every moving player picking policy_fn(state, hidden_state, player).
+    Skips the checks in transition. Returns the terminal value.
+    """
+    while state.status != 'end':
+        moves = [ policy_fn(state, hidden_state, player) for player in state.moving_players() ]
+        state, hidden_state, _ = state.transition_unchecked(moves, hidden_state)
+    return state.terminal_value(hidden_state)
 
 
 if __name__ == "__main__":
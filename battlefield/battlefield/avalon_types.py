@@ -1,5 +1,10 @@
-from collections import namedtuple
+from collections import namedtuple, OrderedDict
 import itertools
+import os
+import cPickle as pickle
+import numpy as np
+
+HIDDEN_STATES_CACHE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), 'bots', 'data', 'hidden_states'))
 
 AVALON_PROPOSE_SIZES = {
     5:  [(2, 1), (3, 1), (2, 1), (3, 1), (3, 1)],
@@ -22,24 +27,221 @@ AVALON_PLAYER_COUNT = {
 EVIL_ROLES = set(['minion', 'mordred', 'morgana', 'assassin', 'oberon'])
 GOOD_ROLES = set(['servant', 'merlin', 'percival'])
 
+ROLES = ['servant', 'merlin', 'percival', 'minion', 'assassin', 'mordred', 'morgana', 'oberon']
+ROLE_CODES = { role: i for i, role in enumerate(ROLES) }
+
+BIT_COUNTS = np.array([bin(i).count('1') for i in range(1 << 10)], dtype=np.int8)
+
 ProposeAction = namedtuple('ProposeAction', ['proposal'])
 VoteAction = namedtuple('VoteAction', ['up'])
 MissionAction = namedtuple('MissionAction', ['fail'])
 PickMerlinAction = namedtuple('PickMerlinAction', ['merlin'])
 
 
+class LegalActions(tuple):
+    """
+    An immutable list of legal actions. index() is a dict lookup instead of a linear scan.
+    """
+    def __new__(cls, actions):
+        self = super(LegalActions, cls).__new__(cls, actions)
+        self.indices = { action: i for i, action in enumerate(self) }
+        return self
+
+
+    def index(self, action):
+        if action not in self.indices:
+            raise ValueError("{} is not a legal action".format(action))
+        return self.indices[action]
+
+
+def build_legal_actions_table():
+    table = {}
+    for num_players, sizes in AVALON_PROPOSE_SIZES.items():
+        vote_actions = LegalActions([VoteAction(up=True), VoteAction(up=False)])
+        merlin_actions = LegalActions([PickMerlinAction(merlin=p) for p in range(num_players)])
+        good_mission_actions = LegalActions([MissionAction(fail=False)])
+        evil_mission_actions = LegalActions([MissionAction(fail=False), MissionAction(fail=True)])
+        for round_, (proposal_size, _) in enumerate(sizes):
+            table[(num_players, round_, 'propose', False)] = LegalActions([
+                ProposeAction(proposal=p) for p in itertools.combinations(range(num_players), r=proposal_size)
+            ])
+            table[(num_players, round_, 'vote', False)] = vote_actions
+            table[(num_players, round_, 'run', False)] = good_mission_actions
+            table[(num_players, round_, 'run', True)] = evil_mission_actions
+        for round_ in range(3, 6):
+            table[(num_players, round_, 'merlin', False)] = merlin_actions
+    return table
+
+# Keyed on (num_players, round, status, is_evil). is_evil is only ever True for 'run', since that's the
+# only status where good and evil players have different options.
+LEGAL_ACTIONS = build_legal_actions_table()
+
+
+def proposal_to_mask(proposal):
+    result = 0
+    for p in proposal:
+        result |= (1 << p)
+    return result
+
+
+MAX_PUBLIC_MASKS = 2000
+class HiddenStateIndex(object):
+    """
+    The canonical list of hidden states for a set of roles and a number of players, alongside a matrix of
+    role codes and the bitmask of evil players for each hidden state. Filters are boolean masks over it.
+    """
+    def __init__(self, roles, num_players):
+        self.roles = frozenset(roles)
+        self.num_players = num_players
+        self.hidden_states = possible_hidden_states(roles, num_players)
+        self.positions = { hidden_state: i for i, hidden_state in enumerate(self.hidden_states) }
+        self.role_codes = np.array([
+            [ROLE_CODES[role] for role in hidden_state]
+            for hidden_state in self.hidden_states
+        ], dtype=np.int8)
+        is_evil = np.isin(self.role_codes, [ROLE_CODES[role] for role in EVIL_ROLES])
+        self.evil_mask = np.sum(is_evil.astype(np.int32) << np.arange(num_players), axis=1).astype(np.int32)
+        self.fail_filters = {}
+        # In least recently used order, so the masks of games still being played stay cached
+        self.public_masks = OrderedDict()
+
+
+    def __len__(self):
+        return len(self.hidden_states)
+
+
+    def indices_of(self, hidden_states):
+        return np.fromiter((self.positions[hidden_state] for hidden_state in hidden_states), dtype=np.int64, count=len(hidden_states))
+
+
+    def fail_filter(self, proposal, num_fails_observed):
+        """
+        Boolean mask of the hidden states with at least num_fails_observed evil players on the proposal
+        """
+        key = (proposal_to_mask(proposal), num_fails_observed)
+        if key not in self.fail_filters:
+            self.fail_filters[key] = BIT_COUNTS[self.evil_mask & key[0]] >= num_fails_observed
+        return self.fail_filters[key]
+
+
+    def public_mask(self, observations):
+        """
+        Boolean mask of the hidden states consistent with a sequence of (proposal, num_fails_observed) mission results
+        """
+        if observations in self.public_masks:
+            mask = self.public_masks.pop(observations)
+            self.public_masks[observations] = mask
+            return mask
+        if len(observations) == 0:
+            mask = np.ones(len(self.hidden_states), dtype=bool)
+        else:
+            mask = self.public_mask(observations[:-1]) & self.fail_filter(*observations[-1])
+        self.public_masks[observations] = mask
+        while len(self.public_masks) > MAX_PUBLIC_MASKS:
+            self.public_masks.popitem(last=False)
+        return mask
+
+
+    def knowledge_filter(self, player, real_hidden_state):
+        """
+        Boolean mask of the hidden states consistent with what player knows at the start of the game
+        """
+        role_codes = self.role_codes
+        role = real_hidden_state[player]
+        mask = role_codes[:, player] == ROLE_CODES[role]
+
+        if role in EVIL_ROLES and role != 'oberon': # If we're evil and not oberon
+            for p, other_role in enumerate(real_hidden_state):
+                if p != player and other_role in EVIL_ROLES and other_role != 'oberon': # We know who's who for evil, but not who's oberon
+                    mask &= role_codes[:, p] == ROLE_CODES[other_role]
+
+        if role == 'merlin': # If we're merlin
+            seen_as_evil = [ROLE_CODES[r] for r in EVIL_ROLES - set(['oberon', 'mordred'])]
+            for p, other_role in enumerate(real_hidden_state):
+                if p != player and other_role in EVIL_ROLES and other_role not in ['oberon', 'mordred']: # We know who's evil, but not oberon or mordred
+                    mask &= np.isin(role_codes[:, p], seen_as_evil)
+
+        if role == 'percival': # If we're percival
+            for p, other_role in enumerate(real_hidden_state):
+                if p != player and other_role in ['merlin', 'morgana']:
+                    mask &= np.isin(role_codes[:, p], [ROLE_CODES['merlin'], ROLE_CODES['morgana']])
+
+        return mask
+
+
+HIDDEN_STATE_INDEXES = {}
+def get_hidden_state_index(roles, num_players):
+    """
+    Returns the shared HiddenStateIndex for these roles. roles can be any hidden state of the game.
+    """
+    key = (frozenset(roles), num_players)
+    if key not in HIDDEN_STATE_INDEXES:
+        HIDDEN_STATE_INDEXES[key] = HiddenStateIndex(key[0], num_players)
+    return HIDDEN_STATE_INDEXES[key]
+
+
 def filter_hidden_states(hidden_states, proposal, num_fails_observed):
-    return [
-        hidden_state
-        for hidden_state in hidden_states
-        if sum([1 for player in proposal if hidden_state[player] in EVIL_ROLES ]) >= num_fails_observed
-    ]
+    if len(hidden_states) == 0:
+        return []
+    index = get_hidden_state_index(hidden_states[0], len(hidden_states[0]))
+    keep = index.fail_filter(proposal, num_fails_observed)[index.indices_of(hidden_states)]
+    return [ hidden_state for hidden_state, k in zip(hidden_states, keep) if k ]
 
 
-def possible_hidden_states(roles, num_players):
+def multiset_permutations(items):
+    """
+    Yields every distinct ordering of items exactly once, in lexicographic order
+    """
+    items = sorted(items)
+    n = len(items)
+    while True:
+        yield tuple(items)
+        i = n - 2
+        while i >= 0 and items[i] >= items[i + 1]:
+            i -= 1
+        if i < 0:
+            return
+        j = n - 1
+        while items[j] <= items[i]:
+            j -= 1
+        items[i], items[j] = items[j], items[i]
+        items[i + 1:] = items[:i:-1]
+
+
+def hidden_states_cache_file(roles, num_players):
+    return os.path.join(HIDDEN_STATES_CACHE_DIR, '{}_{}.pkl'.format(num_players, '-'.join(sorted(roles))))
+
+
+def load_cached_hidden_states(roles, num_players):
+    filename = hidden_states_cache_file(roles, num_players)
+    if not os.path.isfile(filename):
+        return None
+    with open(filename, 'rb') as f:
+        return pickle.load(f)
+
+
+def save_cached_hidden_states(roles, num_players, hidden_states):
+    filename = hidden_states_cache_file(roles, num_players)
+    try:
+        if not os.path.isdir(HIDDEN_STATES_CACHE_DIR):
+            os.makedirs(HIDDEN_STATES_CACHE_DIR)
+        # Write then rename, so parallel workers never read a partial file
+        tmp_filename = '{}.{}.tmp'.format(filename, os.getpid())
+        with open(tmp_filename, 'wb') as f:
+            pickle.dump(hidden_states, f, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_filename, filename)
+    except (IOError, OSError):
+        pass
+
+
+def enumerate_hidden_states(roles, num_players):
+    """
+    Every hidden state of a game with roles, filled up with minions and servants. Skips both caches.
+    """
     roles = set(roles)
     assert 'assassin' in roles, "All games require an assassin: {}".format(roles)
     assert 'merlin' in roles, "All games require a merlin: {}".format(roles)
+
     output_roles = list(roles)
     num_good_needed, num_evil_needed = AVALON_PLAYER_COUNT[num_players]
     num_good_have = len(roles & GOOD_ROLES)
@@ -47,32 +249,32 @@ def possible_hidden_states(roles, num_players):
     output_roles.extend(['minion']*(num_evil_needed - num_evil_have))
     output_roles.extend(['servant']*(num_good_needed - num_good_have))
     assert len(output_roles) == num_players, "not sure what happened"
-    return list(set(itertools.permutations(output_roles)))
+    return list(multiset_permutations(output_roles))
+
+
+POSSIBLE_HIDDEN_STATES = {}
+def possible_hidden_states(roles, num_players):
+    roles = set(roles)
+    key = (frozenset(roles), num_players)
+    if key in POSSIBLE_HIDDEN_STATES:
+        return list(POSSIBLE_HIDDEN_STATES[key])
+
+    assert 'assassin' in roles, "All games require an assassin: {}".format(roles)
+    assert 'merlin' in roles, "All games require a merlin: {}".format(roles)
+
+    hidden_states = load_cached_hidden_states(roles, num_players)
+    if hidden_states is None:
+        hidden_states = enumerate_hidden_states(roles, num_players)
+        save_cached_hidden_states(roles, num_players, hidden_states)
 
+    POSSIBLE_HIDDEN_STATES[key] = hidden_states
+    return list(hidden_states)
 
 
 def starting_hidden_states(player, real_hidden_state, possible_hidden_states):
-    knowledge = [(player, [real_hidden_state[player]])] # We know what we are
-    if real_hidden_state[player] in EVIL_ROLES and real_hidden_state[player] != 'oberon': # If we're evil and not oberon
-        for p, role in enumerate(real_hidden_state):
-            if p != player and role in EVIL_ROLES and role != 'oberon': # We know who's who for evil, but not who's oberon
-                knowledge.append((p, [role]))
-
-    if real_hidden_state[player] == 'merlin': # If we're merlin
-        for p, role in enumerate(real_hidden_state):
-            if p != player and role in EVIL_ROLES and role not in ['oberon', 'mordred']: # We know who's evil, but not oberon or mordred
-                knowledge.append((p, EVIL_ROLES - set(['oberon', 'mordred'])))
-
-    if real_hidden_state[player] == 'percival': # If we're percival
-        for p, role in enumerate(real_hidden_state):
-            if p != player and role in ['merlin', 'morgana']:
-                knowledge.append((p, ['merlin', 'morgana']))
-
-    return [
-        hidden_state
-        for hidden_state in possible_hidden_states
-        if all(hidden_state[p] in possible_roles for p, possible_roles in knowledge)
-    ]
+    index = get_hidden_state_index(real_hidden_state, len(real_hidden_state))
+    keep = index.knowledge_filter(player, real_hidden_state)[index.indices_of(possible_hidden_states)]
+    return [ hidden_state for hidden_state, k in zip(possible_hidden_states, keep) if k ]
 
 
 if __name__ == "__main__":
@@ -0,0 +1,108 @@
+import numpy as np
+
+from battlefield.avalon_types import ROLES, get_hidden_state_index
+
+
+class BeliefState(object):
+    """
+    A probability distribution over the canonical hidden states of a game (see HiddenStateIndex).
+
+    It is split into a private prior (what this player knew at the start, times any soft likelihoods) and the
+    public mission results seen since. The public part is a shared mask on the index, so every bot in a game
+    which saw the same missions reuses it. Updates return a new BeliefState and never touch the old one.
+    """
+    def __init__(self, index, prior, observations=()):
+        self.index = index
+        self.prior = prior
+        self.observations = observations
+        self._probs = None
+        self._hidden_states = None
+        self._marginals = None
+        self._cdf = None
+
+
+    @classmethod
+    def uniform(cls, index):
+        return cls(index, np.ones(len(index)))
+
+
+    @classmethod
+    def from_hidden_states(cls, hidden_states):
+        """
+        Uniform over hidden_states, which must all be hidden states of the same game
+        """
+        index = get_hidden_state_index(hidden_states[0], len(hidden_states[0]))
+        if len(hidden_states) == len(index):
+            return cls.uniform(index)
+        prior = np.zeros(len(index))
+        prior[index.indices_of(hidden_states)] = 1.0
+        return cls(index, prior)
+
+
+    def copy(self):
+        return BeliefState(self.index, self.prior, self.observations)
+
+
+    def filter_mission(self, proposal, num_fails_observed):
+        """
+        Drops the hidden states with fewer than num_fails_observed evil players on the proposal
+        """
+        return BeliefState(self.index, self.prior, self.observations + ((tuple(proposal), num_fails_observed),))
+
+
+    def update_likelihood(self, likelihoods):
+        """
+        Bayesian update by the probability of some observation under each canonical hidden state
+        """
+        assert len(likelihoods) == len(self.index), "Need one likelihood per hidden state"
+        return BeliefState(self.index, self.prior * likelihoods, self.observations)
+
+
+    @property
+    def probs(self):
+        if self._probs is None:
+            probs = self.prior * self.index.public_mask(self.observations)
+            total = np.sum(probs)
+            assert total > 0, "No hidden state is consistent with this belief"
+            self._probs = probs / total
+        return self._probs
+
+
+    @property
+    def hidden_states(self):
+        """
+        The hidden states with nonzero probability, in canonical order
+        """
+        if self._hidden_states is None:
+            self._hidden_states = [ self.index.hidden_states[i] for i in np.flatnonzero(self.probs) ]
+        return self._hidden_states
+
+
+    def __len__(self):
+        return len(self.hidden_states)
+
+
+    def items(self):
+        probs = self.probs
+        for i in np.flatnonzero(probs):
+            yield self.index.hidden_states[i], probs[i]
+
+
+    def sample(self, rng=np.random):
+        if self._cdf is None:
+            self._cdf = np.cumsum(self.probs)
+        return self.index.hidden_states[np.searchsorted(self._cdf, rng.random_sample() * self._cdf[-1], side='right')]
+
+
+    def marginals(self):
+        """
+        A (num_players, len(ROLES)) matrix with the probability of each player having each role
+        """
+        if self._marginals is None:
+            probs = self.probs
+            role_codes = self.index.role_codes
+            self._marginals = np.array([
+                probs.dot(role_codes == code)
+                for code in range(len(ROLES))
+            ]).T
+        return self._marginals
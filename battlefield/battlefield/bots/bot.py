@@ -1,5 +1,11 @@
 """Base bot class"""
+from battlefield.cooperative import Return
+
 class Bot:
+    # Tournament workers reuse one instance of a REUSABLE bot for every game it plays in a seat (see
+    # tournament.reset_worker_bot). Only set it if reset() reinitializes everything a game can change.
+    REUSABLE = False
+
     def __init__(self):
         pass
 
@@ -22,6 +28,11 @@ class Bot:
         pass
 
 
+    # context is a dict shared by every seat of one game, for bots which can share work between seats
+    def set_game_context(self, context):
+        pass
+
+
     def handle_transition(self, old_state, new_state, observation, move=None):
         pass
 
@@ -32,3 +43,29 @@ class Bot:
 
     def get_move_probabilities(self, state, legal_actions):
         raise NotImplemented
+
+
+    # Coroutine versions (see battlefield.cooperative) for bots which wait on subprocesses. By default they
+    # just make the blocking call.
+    def reset_coroutine(self, game, player, role, hidden_states):
+        self.reset(game, player, role, hidden_states)
+        yield Return(None)
+
+
+    def handle_transition_coroutine(self, old_state, new_state, observation, move=None):
+        self.handle_transition(old_state, new_state, observation, move=move)
+        yield Return(None)
+
+
+    def get_action_coroutine(self, state, legal_actions):
+        yield Return(self.get_action(state, legal_actions))
+
+
+def share_game_context(bots):
+    """
+    Gives every bot of a game the same, new game context
+    """
+    context = {}
+    for bot in bots:
+        bot.set_game_context(context)
+    return context
@@ -111,6 +111,7 @@ num_random_decisions = 0
 
 class _CFRBot(Bot):
     ITERATION = None
+    REUSABLE = True
 
     def __init__(self):
         pass
@@ -0,0 +1,142 @@
+import struct
+import numpy as np
+
+# See binary_serialize_lookahead in deeprole/code/serialization.cpp for the layout
+MAGIC = 'DRLB'
+VERSION = 1
+HEADER_SIZE = 16
+
+NUM_PLAYERS = 5
+NUM_VIEWPOINTS = 15
+NUM_ASSIGNMENTS = 60
+NUM_PROPOSAL_OPTIONS = 10
+
+NODE_FIELDS = ['type', 'succeeds', 'fails', 'proposer', 'propose_count', 'proposal', 'propose_size', 'first_child', 'num_children', 'data_offset']
+FIELD_INDEX = { field: index for index, field in enumerate(NODE_FIELDS) }
+NODE_TYPES = ['PROPOSE', 'VOTE', 'MISSION', 'TERMINAL_MERLIN', 'TERMINAL_NO_CONSENSUS', 'TERMINAL_TOO_MANY_FAILS', 'TERMINAL_PROPOSE_NN']
+
+# The keys each type of node has in the JSON format, besides type and children
+NODE_KEYS = {
+    'PROPOSE': ['succeeds', 'fails', 'proposer', 'propose_count', 'propose_strat', 'propose_options'],
+    'VOTE': ['succeeds', 'fails', 'proposer', 'propose_count', 'proposal', 'vote_strat'],
+    'MISSION': ['succeeds', 'fails', 'proposal', 'mission_strat'],
+    'TERMINAL_MERLIN': ['succeeds', 'fails', 'merlin_strat'],
+    'TERMINAL_NO_CONSENSUS': [],
+    'TERMINAL_TOO_MANY_FAILS': [],
+    'TERMINAL_PROPOSE_NN': ['succeeds', 'fails', 'proposer', 'propose_count', 'new_belief', 'nozero_belief', 'nn_output'],
+}
+
+
+class BinaryLookahead(object):
+    """
+    A lookahead in deeprole's binary format. Nothing is decoded up front: the node table and the strategies
+    are NumPy views of the bytes, and nodes are read as they are visited. data can be any buffer (a string,
+    or an mmap with the lookahead at offset).
+    """
+    def __init__(self, data, offset=0, length=None):
+        magic, version, num_nodes, num_doubles = struct.unpack_from('<4siii', data, offset)
+        assert magic == MAGIC, "Not a binary lookahead"
+        assert version == VERSION, "Binary lookahead version {} != {}".format(version, VERSION)
+        self.data = data
+        end = len(data) if length is None else offset + length
+        offset += HEADER_SIZE
+        self.options = np.frombuffer(data, dtype='<i4', count=2 * NUM_PROPOSAL_OPTIONS, offset=offset).reshape(2, NUM_PROPOSAL_OPTIONS)
+        offset += self.options.nbytes
+        self.nodes = np.frombuffer(data, dtype='<i4', count=num_nodes * len(NODE_FIELDS), offset=offset).reshape(num_nodes, len(NODE_FIELDS))
+        offset += self.nodes.nbytes
+        self.doubles = np.frombuffer(data, dtype='<f8', count=num_doubles, offset=offset)
+        assert offset + self.doubles.nbytes == end, "Binary lookahead has trailing bytes"
+
+
+    def root(self):
+        return LookaheadNodeView(self, 0)
+
+
+class LookaheadChildren(object):
+    def __init__(self, lookahead, first_child, num_children):
+        self.lookahead = lookahead
+        self.first_child = first_child
+        self.num_children = num_children
+
+
+    def __len__(self):
+        return self.num_children
+
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.num_children
+        if not 0 <= index < self.num_children:
+            raise IndexError(index)
+        return LookaheadNodeView(self.lookahead, self.first_child + index)
+
+
+    def __iter__(self):
+        for index in range(self.num_children):
+            yield self[index]
+
+
+class LookaheadNodeView(object):
+    """
+    One node of a BinaryLookahead, read like the dict json.loads makes of the same node
+    """
+    def __init__(self, lookahead, index):
+        self.lookahead = lookahead
+        self.fields = lookahead.nodes[index]
+        self.type = NODE_TYPES[self.fields[FIELD_INDEX['type']]]
+
+
+    def field(self, name):
+        return int(self.fields[FIELD_INDEX[name]])
+
+
+    def strategy(self, shape):
+        offset = self.field('data_offset')
+        return self.lookahead.doubles[offset:offset + int(np.prod(shape))].reshape(shape)
+
+
+    def keys(self):
+        keys = ['type'] + NODE_KEYS[self.type]
+        if self.field('num_children') > 0:
+            keys.append('children')
+        if self.type == 'TERMINAL_PROPOSE_NN' and self.field('data_offset') < 0:
+            keys.remove('nozero_belief')
+        return keys
+
+
+    def __contains__(self, key):
+        return key in self.keys()
+
+
+    def __getitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+
+        if key == 'type':
+            return self.type
+        elif key == 'children':
+            return LookaheadChildren(self.lookahead, self.field('first_child'), self.field('num_children'))
+        elif key == 'propose_options':
+            return list(self.lookahead.options[self.field('propose_size') - 2])
+        elif key == 'propose_strat':
+            return self.strategy((NUM_VIEWPOINTS, NUM_PROPOSAL_OPTIONS))
+        elif key == 'vote_strat':
+            return self.strategy((NUM_PLAYERS, NUM_VIEWPOINTS, 2))
+        elif key == 'mission_strat':
+            strategy = self.strategy((NUM_PLAYERS, NUM_VIEWPOINTS, 2))
+            proposal = self.field('proposal')
+            return [ strategy[player] if proposal & (1 << player) else None for player in range(NUM_PLAYERS) ]
+        elif key == 'merlin_strat':
+            return self.strategy((NUM_PLAYERS, NUM_VIEWPOINTS, NUM_PLAYERS))
+        elif key in ['new_belief', 'nozero_belief', 'nn_output']:
+            offset = self.field('data_offset')
+            if offset < 0:
+                return 'impossible' if key == 'new_belief' else 'n/a'
+            if key == 'nn_output':
+                offset += 2 * NUM_ASSIGNMENTS
+                return self.lookahead.doubles[offset:offset + NUM_PLAYERS * NUM_VIEWPOINTS].reshape(NUM_PLAYERS, NUM_VIEWPOINTS)
+            if key == 'nozero_belief':
+                offset += NUM_ASSIGNMENTS
+            return self.lookahead.doubles[offset:offset + NUM_ASSIGNMENTS]
+        else:
+            return self.field(key)
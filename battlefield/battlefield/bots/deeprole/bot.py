@@ -3,7 +3,7 @@ import numpy as np
 from battlefield.bots.bot import Bot
 from battlefield.avalon_types import EVIL_ROLES, GOOD_ROLES, MissionAction, VoteAction, ProposeAction, PickMerlinAction
 from battlefield.bots.deeprole.lookup_tables import get_deeprole_perspective, assignment_id_to_hidden_state, print_top_k_belief, print_top_k_viewpoint_belief
-from battlefield.bots.deeprole.run_deeprole import run_deeprole_on_node
+from battlefield.bots.deeprole.run_deeprole import run_deeprole_on_node, run_deeprole_on_node_coroutine
 from battlefield.bots.cfr_bot import proposal_to_bitstring, bitstring_to_proposal
 
 START_NODE = {
@@ -43,6 +43,7 @@ class Deeprole(Bot):
     WAIT_ITERATIONS = 50
     NO_ZERO=False
     NN_FOLDER='deeprole_models'
+    REUSABLE = True
 
     def __init__(self):
         pass
@@ -50,34 +51,81 @@ class Deeprole(Bot):
 
     def reset(self, game, player, role, hidden_states):
         self.node = run_deeprole_on_node(START_NODE, self.ITERATIONS, self.WAIT_ITERATIONS, no_zero=self.NO_ZERO, nn_folder=self.NN_FOLDER)
+        self.path = ()
+        self.public_solves = {}
         self.player = player
         self.perspective = get_deeprole_perspective(player, hidden_states[0])
         # print self.perspective
 
 
+    def reset_coroutine(self, game, player, role, hidden_states):
+        self.node = yield run_deeprole_on_node_coroutine(START_NODE, self.ITERATIONS, self.WAIT_ITERATIONS, no_zero=self.NO_ZERO, nn_folder=self.NN_FOLDER)
+        self.path = ()
+        self.public_solves = {}
+        self.player = player
+        self.perspective = get_deeprole_perspective(player, hidden_states[0])
+
+
+    def set_game_context(self, context):
+        # Every Deeprole seat of a game walks the same public tree, so the first seat to reach a node solves it
+        # for all of them
+        self.public_solves = context.setdefault('deeprole_public_solves', {})
+
+
+    def public_solve_key(self):
+        return (self.ITERATIONS, self.WAIT_ITERATIONS, self.NO_ZERO, self.NN_FOLDER, self.path)
+
+
     def handle_transition(self, old_state, new_state, observation, move=None):
         if old_state.status == 'merlin':
             return
 
+        self.follow_observation(old_state, observation)
+
+        if self.node['type'] == 'TERMINAL_PROPOSE_NN':
+            # print_top_k_belief(self.node['new_belief'])
+            # print "Player {} perspective {}".format(self.player, self.perspective)
+            # print_top_k_viewpoint_belief(self.node['new_belief'], self.player, self.perspective)
+            # print self.node['new_belief']
+            key = self.public_solve_key()
+            if key not in self.public_solves:
+                self.public_solves[key] = run_deeprole_on_node(self.node, self.ITERATIONS, self.WAIT_ITERATIONS, no_zero=self.NO_ZERO, nn_folder=self.NN_FOLDER)
+            self.node = self.public_solves[key]
+
+        self.check_node(new_state)
+
+
+    def handle_transition_coroutine(self, old_state, new_state, observation, move=None):
+        if old_state.status == 'merlin':
+            return
+
+        self.follow_observation(old_state, observation)
+
+        if self.node['type'] == 'TERMINAL_PROPOSE_NN':
+            key = self.public_solve_key()
+            if key not in self.public_solves:
+                self.public_solves[key] = yield run_deeprole_on_node_coroutine(self.node, self.ITERATIONS, self.WAIT_ITERATIONS, no_zero=self.NO_ZERO, nn_folder=self.NN_FOLDER)
+            self.node = self.public_solves[key]
+
+        self.check_node(new_state)
+
+
+    def follow_observation(self, old_state, observation):
         if old_state.status == 'propose':
             proposal = observation
             bitstring = proposal_to_bitstring(proposal)
             child_index = self.node['propose_options'].index(bitstring)
-            self.node = self.node['children'][child_index]
         elif old_state.status == 'vote':
             child_index = votes_to_bitstring(observation)
-            self.node = self.node['children'][child_index]
         elif old_state.status == 'run':
-            num_fails = observation
-            self.node = self.node['children'][num_fails]
+            child_index = observation
+        else:
+            return
+        self.node = self.node['children'][child_index]
+        self.path += (child_index,)
 
-        if self.node['type'] == 'TERMINAL_PROPOSE_NN':
-            # print_top_k_belief(self.node['new_belief'])
-            # print "Player {} perspective {}".format(self.player, self.perspective)
-            # print_top_k_viewpoint_belief(self.node['new_belief'], self.player, self.perspective)
-            # print self.node['new_belief']
-            self.node = run_deeprole_on_node(self.node, self.ITERATIONS, self.WAIT_ITERATIONS, no_zero=self.NO_ZERO, nn_folder=self.NN_FOLDER)
 
+    def check_node(self, new_state):
         if self.node['type'].startswith("TERMINAL_") and self.node['type'] != "TERMINAL_MERLIN":
             return
 
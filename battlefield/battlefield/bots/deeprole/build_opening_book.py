@@ -0,0 +1,88 @@
+"""
+Builds the Deeprole opening book: plays self-play games with each Deeprole variant, and solves the nodes of
+the first rounds they asked for most often.
+
+    python -m battlefield.bots.deeprole.build_opening_book Deeprole Deeprole_10_5 [...]
+"""
+import os
+import sys
+import random
+from collections import Counter
+
+import battlefield.bots.deeprole.run_deeprole as run_deeprole
+import battlefield.bots.deeprole.bot as deeprole_bots
+from battlefield.bots.deeprole.opening_book import OpeningBook, write_opening_book
+from battlefield.avalon import AvalonState
+from battlefield.avalon_types import possible_hidden_states, starting_hidden_states, multiset_permutations
+from battlefield.tournament import run_game
+from battlefield.cooperative import Return, run_concurrently
+
+ROLES = ['merlin', 'servant', 'assassin', 'minion', 'servant']
+
+
+def collect_openings(bot_cls, games, max_round):
+    """
+    Plays games of five bot_cls, and returns how often each node up to max_round was asked for, and the
+    arguments to solve each of them
+    """
+    start_state = AvalonState.start_state(len(ROLES))
+    all_hidden_states = possible_hidden_states(set(ROLES), num_players=len(ROLES))
+    hidden_states = list(multiset_permutations(ROLES))
+    counts = Counter()
+    requests = {}
+    for _ in range(games):
+        hidden_state = random.choice(hidden_states)
+        run_deeprole.solve_log = []
+        bots = [
+            bot_cls.create_and_reset(start_state, player, role, starting_hidden_states(player, hidden_state, all_hidden_states))
+            for player, role in enumerate(hidden_state)
+        ]
+        run_game(start_state, hidden_state, bots)
+        for key, node, iterations, wait_iterations, no_zero, nn_folder in run_deeprole.solve_log:
+            if node['succeeds'] + node['fails'] > max_round:
+                continue
+            counts[key] += 1
+            if key not in requests:
+                # Copied, so the lookahead the node came from isn't kept alive
+                node = {
+                    'proposer': node['proposer'],
+                    'succeeds': node['succeeds'],
+                    'fails': node['fails'],
+                    'propose_count': node['propose_count'],
+                    'new_belief': list(node['new_belief']),
+                    'nozero_belief': list(node['nozero_belief'])
+                }
+                requests[key] = (node, iterations, wait_iterations, no_zero, nn_folder)
+    run_deeprole.solve_log = None
+    return counts, requests
+
+
+def solve_output(key, node, iterations, wait_iterations, no_zero, nn_folder):
+    output = yield run_deeprole.deeprole_call(node, iterations, wait_iterations, no_zero, nn_folder)
+    yield Return((key, output))
+
+
+def build_opening_book(bot_classes, games=100, max_round=2, nodes_per_bot=200, filename=run_deeprole.OPENING_BOOK_FILE):
+    """
+    Adds the nodes_per_bot most asked for nodes up to max_round (0 is the first mission) of games self-play
+    games of each of bot_classes to the opening book at filename
+    """
+    assert run_deeprole.BINARY_LOOKAHEAD, "Opening books hold binary lookaheads"
+    entries = OpeningBook(filename).entries() if os.path.exists(filename) else {}
+    # Solve every node afresh rather than out of an older book
+    run_deeprole.use_opening_book(None)
+
+    for bot_cls in bot_classes:
+        print "Collecting openings of {}".format(bot_cls.__name__)
+        counts, requests = collect_openings(bot_cls, games, max_round)
+        keys = [ key for key, _ in counts.most_common(nodes_per_bot) if key not in entries ]
+        print "Solving {} nodes".format(len(keys))
+        for key, output in run_concurrently([ solve_output(key, *requests[key]) for key in keys ]):
+            entries[key] = output
+
+    write_opening_book(filename, entries)
+    run_deeprole.use_opening_book(filename)
+
+
+if __name__ == "__main__":
+    build_opening_book([ getattr(deeprole_bots, name) for name in sys.argv[1:] ])
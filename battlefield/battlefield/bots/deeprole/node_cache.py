@@ -0,0 +1,131 @@
+import os
+import hashlib
+import sqlite3
+import numpy as np
+from collections import OrderedDict
+
+
+def quantize_belief(belief, mantissa_bits):
+    """
+    Rounds each probability to mantissa_bits significant bits, so beliefs that only differ by floating point
+    noise share a key. Zeros stay zero and tiny probabilities stay tiny. None leaves the belief exact.
+    """
+    belief = np.asarray(belief, dtype=np.float64)
+    if mantissa_bits is None:
+        return belief
+    mantissa, exponent = np.frexp(belief)
+    return np.ldexp(np.round(mantissa * (1 << mantissa_bits)) / (1 << mantissa_bits), exponent)
+
+
+def node_key(node, iterations, wait_iterations, no_zero, nn_folder, mantissa_bits):
+    key = hashlib.sha1(repr((
+        node['proposer'],
+        node['succeeds'],
+        node['fails'],
+        node['propose_count'],
+        iterations,
+        wait_iterations,
+        no_zero,
+        nn_folder
+    )))
+    key.update(quantize_belief(node['new_belief'], mantissa_bits).tobytes())
+    return key.hexdigest()
+
+
+class SqliteNodeStore(object):
+    """
+    Solved nodes in a sqlite file, shared by every process (and every tournament) pointed at it. Each process
+    opens its own connection on first use, so a store can be created before forking.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self.pid = None
+        self.connection = None
+
+
+    def connect(self):
+        if self.pid != os.getpid():
+            self.connection = sqlite3.connect(self.filename, timeout=60)
+            self.connection.execute('CREATE TABLE IF NOT EXISTS nodes (key TEXT PRIMARY KEY, output BLOB)')
+            self.connection.commit()
+            self.pid = os.getpid()
+        return self.connection
+
+
+    def get(self, key):
+        row = self.connect().execute('SELECT output FROM nodes WHERE key = ?', (key,)).fetchone()
+        return None if row is None else str(row[0])
+
+
+    def put(self, key, output):
+        connection = self.connect()
+        connection.execute('INSERT OR IGNORE INTO nodes (key, output) VALUES (?, ?)', (key, buffer(output)))
+        connection.commit()
+
+
+class NodeCache(object):
+    """
+    Parsed Deeprole solves in least recently used order, evicted once their outputs add up to more than
+    max_bytes. Misses fall through to store (a SqliteNodeStore, or None) before anything is solved.
+    """
+    def __init__(self, max_bytes, store=None):
+        self.max_bytes = max_bytes
+        self.store = store
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.store_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+
+    def get(self, key, parse):
+        if key in self.entries:
+            entry = self.entries.pop(key)
+            self.entries[key] = entry
+            self.hits += 1
+            return entry[0]
+
+        if self.store is not None:
+            output = self.store.get(key)
+            if output is not None:
+                self.store_hits += 1
+                return self.add(key, output, parse)
+
+        self.misses += 1
+        return None
+
+
+    def put(self, key, output, parse):
+        if self.store is not None:
+            self.store.put(key, output)
+        return self.add(key, output, parse)
+
+
+    def add(self, key, output, parse):
+        if key in self.entries:
+            return self.entries[key][0]
+        value = parse(output)
+        self.entries[key] = (value, len(output))
+        self.bytes += len(output)
+        while self.bytes > self.max_bytes and len(self.entries) > 1:
+            _, (_, size) = self.entries.popitem(last=False)
+            self.bytes -= size
+            self.evictions += 1
+        return value
+
+
+    def clear(self):
+        self.entries.clear()
+        self.bytes = 0
+
+
+    def stats(self):
+        return {
+            'entries': len(self.entries),
+            'bytes': self.bytes,
+            'hits': self.hits,
+            'store_hits': self.store_hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
@@ -0,0 +1,87 @@
+import os
+import mmap
+import struct
+import numpy as np
+
+from battlefield.bots.deeprole.binary_lookahead import BinaryLookahead
+
+# Layout: header (magic, version, count, padding), an index of count entries sorted by key, then each entry's
+# binary lookahead starting on an 8 byte boundary so its float64s can be viewed in place
+MAGIC = 'DRBK'
+VERSION = 1
+HEADER_SIZE = 16
+INDEX_DTYPE = np.dtype([('key', 'S40'), ('offset', '<u8'), ('length', '<u8')])
+
+
+class OpeningBook(object):
+    """
+    Solved Deeprole nodes, keyed like the node cache (see node_cache.node_key), read straight out of a memory
+    mapped file. Every process using the same book shares its pages.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, 'rb') as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, count = struct.unpack_from('<4sii', self.mmap, 0)
+        assert magic == MAGIC, "{} is not an opening book".format(filename)
+        assert version == VERSION, "{} is opening book version {}, not {}".format(filename, version, VERSION)
+        self.index = np.frombuffer(self.mmap, dtype=INDEX_DTYPE, count=count, offset=HEADER_SIZE)
+        self.nodes = {}
+        self.hits = 0
+
+
+    def __len__(self):
+        return len(self.index)
+
+
+    def find(self, key):
+        position = np.searchsorted(self.index['key'], key)
+        if position < len(self.index) and self.index['key'][position] == key:
+            return position
+        return None
+
+
+    def get(self, key):
+        if key in self.nodes:
+            self.hits += 1
+            return self.nodes[key]
+        position = self.find(key)
+        if position is None:
+            return None
+        entry = self.index[position]
+        self.nodes[key] = BinaryLookahead(self.mmap, offset=int(entry['offset']), length=int(entry['length'])).root()
+        self.hits += 1
+        return self.nodes[key]
+
+
+    def entries(self):
+        """
+        {key: binary lookahead} of every node in the book, copied out of the file
+        """
+        return {
+            entry['key']: self.mmap[int(entry['offset']):int(entry['offset'] + entry['length'])]
+            for entry in self.index
+        }
+
+
+def write_opening_book(filename, entries):
+    """
+    Writes {key: binary lookahead} as an opening book
+    """
+    keys = sorted(entries)
+    index = np.zeros(len(keys), dtype=INDEX_DTYPE)
+    offset = HEADER_SIZE + index.nbytes
+    for position, key in enumerate(keys):
+        offset += -offset % 8
+        index[position] = (key, offset, len(entries[key]))
+        offset += len(entries[key])
+
+    print "Writing {}".format(filename)
+    tmp_filename = filename + '.tmp'
+    with open(tmp_filename, 'wb') as f:
+        f.write(struct.pack('<4sii', MAGIC, VERSION, len(keys)).ljust(HEADER_SIZE, '\0'))
+        f.write(index.tobytes())
+        for position, key in enumerate(keys):
+            f.write('\0' * (int(index[position]['offset']) - f.tell()))
+            f.write(entries[key])
+    os.rename(tmp_filename, filename)
@@ -1,12 +1,32 @@
-import subprocess
 import json
 import os
 import numpy as np
 
 from battlefield.bots.deeprole.lookup_tables import ASSIGNMENT_TO_VIEWPOINT
+from battlefield.bots.deeprole.binary_lookahead import BinaryLookahead
+from battlefield.bots.deeprole.node_cache import NodeCache, SqliteNodeStore, node_key
+from battlefield.bots.deeprole.opening_book import OpeningBook
+from battlefield.cooperative import SubprocessCall, WorkerPool, Return, run_to_completion, cores_per_process
 
 DEEPROLE_BASE_DIR = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'deeprole')
 DEEPROLE_BINARY = os.path.join(DEEPROLE_BASE_DIR, 'code', 'deeprole')
+# Solve on long-lived `deeprole --serve` processes which keep their models loaded, instead of starting a
+# `deeprole --play` process per public node. Turn off for binaries built before --serve existed.
+USE_SOLVER_POOL = True
+# Have deeprole answer in its binary format, read lazily, instead of JSON. Also needs a binary built from this tree.
+BINARY_LOOKAHEAD = True
+# Most solver processes started per model folder, in each Python process. None gives each process its share of
+# the machine's cores (see cooperative.share_cores), so a pool of tournament processes doesn't start cores**2.
+SOLVER_POOL_SIZE = None
+# Solved nodes kept in memory by each process, counted by the size of deeprole's output
+CACHE_MAX_BYTES = 256 * 1024 * 1024
+# Beliefs are rounded to this many significant bits for cache keys (None keys on the exact floats). Fewer bits
+# reuse more solves, at the cost of answering a node with the solve of a slightly different belief.
+CACHE_BELIEF_BITS = 32
+# A sqlite file shared by every worker of a tournament (and every later run), or None to only cache in memory
+CACHE_STORE = os.environ.get('DEEPROLE_CACHE_STORE')
+# Built by battlefield.bots.deeprole.build_opening_book, and checked before the cache
+OPENING_BOOK_FILE = os.environ.get('DEEPROLE_OPENING_BOOK', 'tournaments/deeprole_opening_book.bin')
 
 def marginalize_belief(belief):
     player_beliefs = [ np.zeros(15) for _ in range(5) ]
@@ -36,9 +56,72 @@ def marginalize_belief(belief):
     return list(result / np.sum(result))
 
 
-deeprole_cache = {}
+deeprole_cache = NodeCache(CACHE_MAX_BYTES, store=None if CACHE_STORE is None else SqliteNodeStore(CACHE_STORE))
+# Solves started but not finished yet, so concurrent games at the same public node share one subprocess
+deeprole_in_flight = {}
+# None until first checked, False if there is no book
+opening_book = None
+# When set to a list (by the opening book builder), every node asked for is appended to it as
+# (cache key, node, iterations, wait_iterations, no_zero, nn_folder)
+solve_log = None
+
+
+def use_opening_book(filename):
+    """
+    Answers nodes out of the opening book filename (or none, if None)
+    """
+    global opening_book
+    opening_book = False if filename is None or not os.path.exists(filename) else OpeningBook(filename)
+
+
+def use_cache_store(filename):
+    """
+    Shares solved nodes through the sqlite file filename (or stops sharing, if None). Processes forked
+    afterwards share it too.
+    """
+    deeprole_cache.store = None if filename is None else SqliteNodeStore(filename)
+
+
+solver_pools = {}
+
+def solver_pool(nn_folder):
+    if nn_folder not in solver_pools:
+        command = [
+            DEEPROLE_BINARY,
+            '--serve',
+            '--depth=1',
+            '--modeldir={}'.format(nn_folder)
+        ]
+        size = cores_per_process() if SOLVER_POOL_SIZE is None else SOLVER_POOL_SIZE
+        solver_pools[nn_folder] = WorkerPool(command, size, cwd=DEEPROLE_BASE_DIR)
+    return solver_pools[nn_folder]
+
+
+def close_solver_pools():
+    for pool in solver_pools.values():
+        pool.close()
+    solver_pools.clear()
+
+
+def deeprole_call(node, iterations, wait_iterations, no_zero, nn_folder):
+    if no_zero:
+        belief = node['nozero_belief']
+    else:
+        belief = node['new_belief']
+
+    if USE_SOLVER_POOL:
+        request = {
+            'proposer': node['proposer'],
+            'succeeds': node['succeeds'],
+            'fails': node['fails'],
+            'propose_count': node['propose_count'],
+            'iterations': iterations,
+            'wait_iterations': wait_iterations,
+            'belief': list(belief),
+            'binary': BINARY_LOOKAHEAD
+        }
+        return solver_pool(nn_folder).call(json.dumps(request))
 
-def actually_run_deeprole_on_node(node, iterations, wait_iterations, no_zero, nn_folder):
     command = [
         DEEPROLE_BINARY,
         '--play',
@@ -51,45 +134,54 @@ def actually_run_deeprole_on_node(node, iterations, wait_iterations, no_zero, nn
         '--witers={}'.format(wait_iterations),
         '--modeldir={}'.format(nn_folder)
     ]
-    process = subprocess.Popen(
-        command,
-        stdin=subprocess.PIPE,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        cwd=DEEPROLE_BASE_DIR
-    )
-
-    if no_zero:
-        belief = node['nozero_belief']
-    else:
-        belief = node['new_belief']
-
-    stdout, _ = process.communicate(input=str(belief) + "\n")
-    result = json.loads(stdout)
-    return result
+    if BINARY_LOOKAHEAD:
+        command.append('--binary')
+
+    return SubprocessCall(command, json.dumps(list(belief)) + "\n", cwd=DEEPROLE_BASE_DIR)
+
+
+def parse_lookahead(output):
+    if output.startswith('DRLB'):
+        return BinaryLookahead(output).root()
+    return json.loads(output)
+
+
+def run_deeprole_on_node_coroutine(node, iterations, wait_iterations, no_zero=False, nn_folder='deeprole_models'):
+    """
+    Coroutine version of run_deeprole_on_node (see battlefield.cooperative)
+    """
+    cache_key = node_key(node, iterations, wait_iterations, no_zero, nn_folder, CACHE_BELIEF_BITS)
+    if solve_log is not None:
+        solve_log.append((cache_key, node, iterations, wait_iterations, no_zero, nn_folder))
+
+    if opening_book is None:
+        use_opening_book(OPENING_BOOK_FILE)
+    if opening_book:
+        booked = opening_book.get(cache_key)
+        if booked is not None:
+            yield Return(booked)
+
+    if cache_key not in deeprole_in_flight:
+        cached = deeprole_cache.get(cache_key, parse_lookahead)
+        if cached is not None:
+            yield Return(cached)
+        deeprole_in_flight[cache_key] = deeprole_call(node, iterations, wait_iterations, no_zero, nn_folder)
+    call = deeprole_in_flight[cache_key]
+    first = False
+    try:
+        stdout = yield call
+    finally:
+        # The first coroutine resumed caches the solve. If the call failed, or its scheduler gave up on it,
+        # this drops it too, so the next coroutine at this node starts a new solve instead of waiting on it.
+        if deeprole_in_flight.get(cache_key) is call:
+            del deeprole_in_flight[cache_key]
+            first = True
+    if first:
+        yield Return(deeprole_cache.put(cache_key, stdout, parse_lookahead))
+    # Shared the solve of another coroutine, which cached it (unless it was evicted since)
+    cached = deeprole_cache.get(cache_key, parse_lookahead)
+    yield Return(parse_lookahead(stdout) if cached is None else cached)
 
 
 def run_deeprole_on_node(node, iterations, wait_iterations, no_zero=False, nn_folder='deeprole_models'):
-    global deeprole_cache
-
-    if len(deeprole_cache) > 250:
-        deeprole_cache = {}
-
-    cache_key = (
-        node['proposer'],
-        node['succeeds'],
-        node['fails'],
-        node['propose_count'],
-        tuple(node['new_belief']),
-        iterations,
-        wait_iterations,
-        no_zero,
-        nn_folder
-    )
-    
-    if cache_key in deeprole_cache:
-        return deeprole_cache[cache_key]
-
-    result = actually_run_deeprole_on_node(node, iterations, wait_iterations, no_zero, nn_folder)
-    deeprole_cache[cache_key] = result
-    return result
+    return run_to_completion(run_deeprole_on_node_coroutine(node, iterations, wait_iterations, no_zero=no_zero, nn_folder=nn_folder))
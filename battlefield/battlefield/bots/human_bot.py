@@ -172,6 +172,8 @@ def read_data_load_counts():
 
 
 class HumanLikeBot(Bot):
+    REUSABLE = True
+
     def __init__(self, counts=None):
         self.counts = read_data_load_counts() if counts is None else counts
         self.player = None
@@ -1,6 +1,7 @@
 import numpy as np
 import random
 from battlefield.avalon_types import GOOD_ROLES
+from battlefield.avalon import rollout
 
 def determinization_iterator(possible_hidden_states, num_iterations):
     i = 0
@@ -19,14 +20,12 @@ def random_choice(values, p=None):
     return values[np.random.choice(range(len(values)), p=p)]
 
 
+def random_policy(game_state, hidden_state, player):
+    return random_choice(game_state.legal_actions_unchecked(player, hidden_state))
+
+
 def simulate(game_state, hidden_state):
-    while not game_state.is_terminal():
-        moves = tuple([
-            random_choice(game_state.legal_actions(player, hidden_state))
-            for player in game_state.moving_players()
-        ])
-        game_state, hidden_state, _ = game_state.transition(moves, hidden_state)
-    return game_state.terminal_value(hidden_state)
+    return rollout(game_state, hidden_state, random_policy)
 
 
 # Assumes each mission has a 50-50 chance of failing or succeeding
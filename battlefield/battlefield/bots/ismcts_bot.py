@@ -2,7 +2,8 @@ import random
 import numpy as np
 
 from battlefield.bots.bot import Bot
-from battlefield.avalon_types import filter_hidden_states, EVIL_ROLES, GOOD_ROLES, VoteAction, ProposeAction, MissionAction
+from battlefield.avalon_types import EVIL_ROLES, GOOD_ROLES, VoteAction, ProposeAction, MissionAction
+from battlefield.belief import BeliefState
 from battlefield.bots.ismcts.ismcts import search_ismcts
 from battlefield.bots.ismcts.moismcts import search_moismcts
 from battlefield.bots.ismcts.mtmoismcts import search_mtmoismcts
@@ -16,7 +17,7 @@ class ISMCTSBot(Bot):
         self.game = game
         self.player = player
         self.role = role
-        self.hidden_states = hidden_states
+        self.belief = BeliefState.from_hidden_states(hidden_states)
         self.is_evil = role in EVIL_ROLES
 
 
@@ -24,14 +25,14 @@ class ISMCTSBot(Bot):
         if old_state.status == 'run':
             if move is not None and self.role in EVIL_ROLES and not move.fail:
                 observation += 1
-            self.hidden_states = filter_hidden_states(self.hidden_states, old_state.proposal, observation)
+            self.belief = self.belief.filter_mission(old_state.proposal, observation)
 
 
     def get_action(self, state, legal_actions):
         if len(legal_actions) == 1:
             return legal_actions[0]
 
-        action, _ = search_ismcts(self.player, state, self.hidden_states, 10000)
+        action, _ = search_ismcts(self.player, state, self.belief.hidden_states, 10000)
         return action
 
 
@@ -49,21 +50,21 @@ class MOISMCTSBot(Bot):
         self.player = player
         self.role = role
         self.is_evil = role in EVIL_ROLES
-        self.hidden_states = hidden_states
+        self.belief = BeliefState.from_hidden_states(hidden_states)
 
 
     def handle_transition(self, old_state, new_state, observation, move=None):
         if old_state.status == 'run':
             if move is not None and self.role in EVIL_ROLES and not move.fail:
                 observation += 1
-            self.hidden_states = filter_hidden_states(self.hidden_states, old_state.proposal, observation)
+            self.belief = self.belief.filter_mission(old_state.proposal, observation)
 
 
     def get_action(self, state, legal_actions):
         if len(legal_actions) == 1:
             return legal_actions[0]
 
-        actions, roots = search_mtmoismcts(self.player, state, self.hidden_states, 10000)
+        actions, roots = search_mtmoismcts(self.player, state, self.belief.hidden_states, 10000)
         root = roots[self.player][self.is_evil]
         while '_no_move' in root.children:
             root = root.children['_no_move']
@@ -6,7 +6,9 @@ import cPickle as pickle
 from collections import defaultdict
 
 from battlefield.bots.bot import Bot
-from battlefield.avalon_types import filter_hidden_states, EVIL_ROLES, GOOD_ROLES, ProposeAction, MissionAction, VoteAction, PickMerlinAction, filter_hidden_states
+from battlefield.avalon_types import EVIL_ROLES, GOOD_ROLES, ProposeAction, MissionAction, VoteAction, PickMerlinAction
+from battlefield.belief import BeliefState
+from battlefield.zobrist import TranspositionTable, extend_history_hash
 from battlefield.bots.cfr_bot import EVIL_LOOKUP, MERLIN_LOOKUP, PROPOSAL_TO_INDEX_LOOKUP, proposal_to_bitstring, bitstring_to_proposal, INDEX_TO_PROPOSAL_2, INDEX_TO_PROPOSAL_3
 from battlefield.bots.single_mcts_bot import heuristic_value_func
 
@@ -129,17 +131,18 @@ class LearningBot(Bot):
     def reset(self, game, player, role, hidden_states):
         self.history = [(None, game)]
         self.player = player
-        self.hidden_states = hidden_states
+        self.belief = BeliefState.from_hidden_states(hidden_states)
         self.player_status = [0, 0, 0, 0, 0]
         self.fails = []
         self.role = role
         self.game_num += 1
 
         print "Training..."
-        random.shuffle(self.hidden_states)
-        for i, h in enumerate(self.hidden_states):
+        training_hidden_states = list(self.belief.hidden_states)
+        random.shuffle(training_hidden_states)
+        for i, h in enumerate(training_hidden_states):
             print i
-            self.cfr_search_fast(game, tuple(h), [], 1.0, i, {})
+            self.cfr_search_fast(game, tuple(h), [], 1.0, i, TranspositionTable())
 
 
     def set_bot_ids(self, bot_ids):
@@ -204,12 +207,12 @@ class LearningBot(Bot):
             # filter hidden states
             if move is not None and self.role in EVIL_ROLES and not move.fail:
                 observation += 1
-            self.hidden_states = filter_hidden_states(self.hidden_states, old_state.proposal, observation)
+            self.belief = self.belief.filter_mission(old_state.proposal, observation)
 
 
     def single_mcts_search(self, state):
         history_len = len(self.history)
-        hidden_state = self.hidden_states[np.random.choice(len(self.hidden_states))]
+        hidden_state = self.belief.sample()
         player_statuses = [
             [0, 0, 0, 0, 0]
             for _ in hidden_state
@@ -264,7 +267,7 @@ class LearningBot(Bot):
             if value is not None:
                 break
 
-            state, _, observation = state.transition(moves, hidden_state)
+            state, _, observation = state.transition_unchecked(moves, hidden_state)
             self.history.append((observation, state))
 
             if state.is_terminal():
@@ -283,13 +286,14 @@ class LearningBot(Bot):
         for _ in range(num_iterations):
             self.single_mcts_search(state)
 
-    def cfr_search(self, state, hidden_state, fails, strategy_probability, t, cache):
+    def cfr_search(self, state, hidden_state, fails, strategy_probability, t, cache, fails_hash=0):
         if state.is_terminal():
             return state.terminal_value(hidden_state)[self.player]
 
-        cache_key = (state.as_key(), tuple(fails))
-        if cache_key in cache:
-            return cache[cache_key]
+        cache_key = state.zobrist ^ fails_hash
+        cached_value = cache.get(cache_key)
+        if cached_value is not None:
+            return cached_value
 
         if np.random.random() < 0.0001:
             print len(cache)
@@ -341,13 +345,15 @@ class LearningBot(Bot):
                 p = np.prod(probs)
                 if p == 0.0:
                     continue
-                new_state, _, observation = state.transition(moves, hidden_state)
+                new_state, _, observation = state.transition_unchecked(moves, hidden_state)
+                new_fails_hash = fails_hash
                 if state.status == 'run' and observation > 0:
                     fails.append((state.proposal, observation))
-                value += p * self.cfr_search(new_state, hidden_state, fails, strategy_probability, t, cache)
+                    new_fails_hash = extend_history_hash(fails_hash, state, observation)
+                value += p * self.cfr_search(new_state, hidden_state, fails, strategy_probability, t, cache, new_fails_hash)
                 if state.status == 'run' and observation > 0:
                     fails.pop()
-            cache[cache_key] = value
+            cache.put(cache_key, value)
             return value
 
 
@@ -369,10 +375,12 @@ class LearningBot(Bot):
             moves = list(moves)
             for action_index in range(len(values)):
                 moves[my_move_index] = move_index_to_move(action_index, state)
-                new_state, _, observation = state.transition(moves, hidden_state)
+                new_state, _, observation = state.transition_unchecked(moves, hidden_state)
+                new_fails_hash = fails_hash
                 if state.status == 'run' and observation > 0:
                     fails.append((state.proposal, observation))
-                values[action_index] += other_p * self.cfr_search(new_state, hidden_state, fails, strategy_probability * p[action_index], t, cache)
+                    new_fails_hash = extend_history_hash(fails_hash, state, observation)
+                values[action_index] += other_p * self.cfr_search(new_state, hidden_state, fails, strategy_probability * p[action_index], t, cache, new_fails_hash)
                 if state.status == 'run' and observation > 0:
                     fails.pop()
 
@@ -380,17 +388,18 @@ class LearningBot(Bot):
         regrets = values - strategy_value
         self.cfr_regret[bucket_type][bucket] += regrets * t
 
-        cache[cache_key] = strategy_value
+        cache.put(cache_key, strategy_value)
         return strategy_value
 
 
-    def cfr_search_fast(self, state, hidden_state, fails, strategy_probability, t, cache):
+    def cfr_search_fast(self, state, hidden_state, fails, strategy_probability, t, cache, fails_hash=0):
         if state.is_terminal():
             return state.terminal_value(hidden_state)[self.player]
 
-        cache_key = (state.as_key(), tuple(fails))
-        if cache_key in cache:
-            return cache[cache_key]
+        cache_key = state.zobrist ^ fails_hash
+        cached_value = cache.get(cache_key)
+        if cached_value is not None:
+            return cached_value
 
         if np.random.random() < 0.0001:
             print len(cache)
@@ -438,13 +447,15 @@ class LearningBot(Bot):
 
         if my_move_index is None:
             value = 0.0
-            new_state, _, observation = state.transition(moves, hidden_state)
+            new_state, _, observation = state.transition_unchecked(moves, hidden_state)
+            new_fails_hash = fails_hash
             if state.status == 'run' and observation > 0:
                 fails.append((state.proposal, observation))
-            value = self.cfr_search_fast(new_state, hidden_state, fails, strategy_probability, t, cache)
+                new_fails_hash = extend_history_hash(fails_hash, state, observation)
+            value = self.cfr_search_fast(new_state, hidden_state, fails, strategy_probability, t, cache, new_fails_hash)
             if state.status == 'run' and observation > 0:
                 fails.pop()
-            cache[cache_key] = value
+            cache.put(cache_key, value)
             return value
 
 
@@ -459,10 +470,12 @@ class LearningBot(Bot):
 
         for action_index in range(len(values)):
             moves[my_move_index] = move_index_to_move(action_index, state)
-            new_state, _, observation = state.transition(moves, hidden_state)
+            new_state, _, observation = state.transition_unchecked(moves, hidden_state)
+            new_fails_hash = fails_hash
             if state.status == 'run' and observation > 0:
                 fails.append((state.proposal, observation))
-            values[action_index] = self.cfr_search_fast(new_state, hidden_state, fails, strategy_probability * p[action_index], t, cache)
+                new_fails_hash = extend_history_hash(fails_hash, state, observation)
+            values[action_index] = self.cfr_search_fast(new_state, hidden_state, fails, strategy_probability * p[action_index], t, cache, new_fails_hash)
             if state.status == 'run' and observation > 0:
                 fails.pop()
 
@@ -470,7 +483,7 @@ class LearningBot(Bot):
         regrets = values - strategy_value
         self.cfr_regret[bucket_type][bucket] += regrets * t
 
-        cache[cache_key] = strategy_value
+        cache.put(cache_key, strategy_value)
         return strategy_value
 
 
@@ -481,7 +494,7 @@ class LearningBot(Bot):
         # if self.should_search:
         #     self.mcts_search(state, num_iterations=100)
 
-        bucket_type, bucket = history_to_bucket(self.hidden_states[0], self.player, self.history, self.player_status)
+        bucket_type, bucket = history_to_bucket(self.belief.hidden_states[0], self.player, self.history, self.player_status)
         my_strategy = np.clip(self.cfr_regret[bucket_type][bucket], 0, None)
 
         if np.sum(my_strategy) == 0:
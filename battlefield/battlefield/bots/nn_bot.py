@@ -4,7 +4,8 @@ import os
 
 from battlefield.bots.bot import Bot
 from battlefield.bots.observe_bot import ObserveBot
-from battlefield.avalon_types import VoteAction, ProposeAction, MissionAction, filter_hidden_states
+from battlefield.avalon_types import VoteAction, ProposeAction, MissionAction
+from battlefield.belief import BeliefState
 
 PROPOSE_MODELFILE = os.path.abspath(os.path.join(os.path.dirname(__file__), 'data', 'propose_model.h5'))
 VOTE_MODELFILE = os.path.abspath(os.path.join(os.path.dirname(__file__), 'data', 'vote_model.h5'))
@@ -35,6 +36,16 @@ def create_perception(hidden_states):
     return np.array(perceptions) / len(hidden_states)
 
 
+def perception_from_belief(belief):
+    """
+    Same as create_perception, but read off the belief's cached role marginals
+    """
+    marginals = belief.marginals()
+    perception = np.zeros((len(ROLES), len(ROLES)))
+    perception[:len(marginals)] = marginals
+    return perception
+
+
 def onehot(player, num_players=5):
     res = np.zeros(num_players)
     if isinstance(player, int):
@@ -54,8 +65,8 @@ class NNBot(Bot):
         self.game = game
         self.player = player
         self.role = role
-        self.hidden_states = hidden_states
-        self.perception = create_perception(self.hidden_states)
+        self.belief = BeliefState.from_hidden_states(hidden_states)
+        self.perception = perception_from_belief(self.belief)
         self.propose_nn_input = [
             np.concatenate([
                 self.perception.flat,
@@ -86,8 +97,8 @@ class NNBot(Bot):
         if old_state.status == 'run':
             # if move is not None and self.role in EVIL_ROLES and not move.fail:
             #     observation += 1
-            self.hidden_states = filter_hidden_states(self.hidden_states, old_state.proposal, observation)
-            self.perception = create_perception(self.hidden_states)
+            self.belief = self.belief.filter_mission(old_state.proposal, observation)
+            self.perception = perception_from_belief(self.belief)
 
             if new_state.status == 'propose':
                 self.propose_nn_input.append(np.concatenate([
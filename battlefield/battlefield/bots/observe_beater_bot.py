@@ -105,6 +105,17 @@ def zeros_10():
 def zeros_2():
     return np.zeros(2)
 
+# The pretrained strategy sums, loaded once per process. Playing only reads them.
+CFR_STRAT = None
+
+def load_cfr_strat():
+    global CFR_STRAT
+    if CFR_STRAT is None:
+        with open('1000000_0.15_strat.pkl') as f:
+            CFR_STRAT = pickle.load(f)
+    return CFR_STRAT
+
+
 class ObserveBeaterBot(Bot):
     def __init__(self):
         self.game_num = 0
@@ -125,9 +136,8 @@ class ObserveBeaterBot(Bot):
 
     def reset(self, game, player, role, hidden_states):
         if self.game_num == 0:
-            with open('1000000_0.15_strat.pkl') as f:
-                self.cfr_strat = pickle.load(f)
-                
+            self.cfr_strat = load_cfr_strat()
+
             # num_iterations = 1000000
             # print "Training for {} iterations...".format(num_iterations)
 
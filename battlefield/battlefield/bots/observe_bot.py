@@ -3,7 +3,8 @@ import numpy as np
 import itertools
 
 from battlefield.bots.bot import Bot
-from battlefield.avalon_types import filter_hidden_states, EVIL_ROLES, GOOD_ROLES, VoteAction, ProposeAction, MissionAction
+from battlefield.avalon_types import EVIL_ROLES, GOOD_ROLES, VoteAction, ProposeAction, MissionAction
+from battlefield.belief import BeliefState
 
 from collections import defaultdict
 
@@ -16,7 +17,7 @@ class ObserveBot(Bot):
         self.game = game
         self.player = player
         self.role = role
-        self.hidden_states = hidden_states
+        self.belief = BeliefState.from_hidden_states(hidden_states)
         self.is_evil = role in EVIL_ROLES
 
 
@@ -24,11 +25,11 @@ class ObserveBot(Bot):
         if old_state.status == 'run':
             if move is not None and self.role in EVIL_ROLES and not move.fail:
                 observation += 1
-            self.hidden_states = filter_hidden_states(self.hidden_states, old_state.proposal, observation)
+            self.belief = self.belief.filter_mission(old_state.proposal, observation)
 
 
     def get_action(self, state, legal_actions, role_guess=None, return_all=False):
-        role_guess = role_guess or random.choice(self.hidden_states)
+        role_guess = role_guess or self.belief.sample()
         if state.status == 'vote':
             if state.propose_count == 4:
                 return VoteAction(up=True)
@@ -50,18 +51,18 @@ class ObserveBot(Bot):
             return MissionAction(fail=True)
 
         if return_all:
-            return legal_actions
+            return list(legal_actions)
         return random.choice(legal_actions)
 
 
     def get_move_probabilities(self, state, legal_actions):
         move_weights = defaultdict(lambda: 0)
-        for role_guess in self.hidden_states:
+        for role_guess, probability in self.belief.items():
             actions = self.get_action(state, legal_actions, role_guess=role_guess, return_all=True)
             if not isinstance(actions, list):
                 actions = [actions]
             for action in actions:
-                move_weights[action] += 1.0 / len(actions)
+                move_weights[action] += probability / len(actions)
 
         result = np.zeros(len(legal_actions))
 
@@ -107,7 +108,7 @@ class ExamineAgreementBot(Bot):
     def handle_transition(self, *args, **kwargs):
         if isinstance(args[2], tuple) and isinstance(args[2][0], VoteAction):
             update_pairings(args[2], self.team_probabilities)
-        print most_likely_team(self.team_probabilities, self.bot.hidden_states)
+        print most_likely_team(self.team_probabilities, self.bot.belief.hidden_states)
         self.bot.handle_transition(*args, **kwargs)
 
 
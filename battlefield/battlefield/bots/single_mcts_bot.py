@@ -2,7 +2,9 @@ import random
 import numpy as np
 
 from battlefield.bots.bot import Bot
-from battlefield.avalon_types import EVIL_ROLES, GOOD_ROLES, MissionAction, VoteAction, PickMerlinAction, filter_hidden_states
+from battlefield.avalon_types import EVIL_ROLES, GOOD_ROLES, MissionAction, VoteAction, PickMerlinAction
+from battlefield.avalon import rollout
+from battlefield.belief import BeliefState
 OPPONENT_TREMBLE = 0.1
 
 
@@ -84,10 +86,10 @@ def hidden_state_iterator(hidden_states, num_searches):
 
 def next_node(node, state, hidden_state, player, move):
     moves = [ move if p == player else select_opponent_move(state, hidden_state, p) for p in state.moving_players() ]
-    state, _, _  = state.transition(moves, hidden_state)
+    state, _, _  = state.transition_unchecked(moves, hidden_state)
     while not state.is_terminal() and player not in state.moving_players():
         moves = [select_opponent_move(state, hidden_state, p) for p in state.moving_players()]
-        state, _, _ = state.transition(moves, hidden_state)
+        state, _, _ = state.transition_unchecked(moves, hidden_state)
 
     key = (move, state.as_key())
     if key in node.children:
@@ -140,11 +142,7 @@ NUM_PLAYOUTS = 5
 def playout_value_func(root_state, hidden_state, player):
     total_payoff = 0
     for _ in range(NUM_PLAYOUTS):
-        state = root_state
-        while not state.is_terminal():
-            moves = [ select_opponent_move(state, hidden_state, p) for p in state.moving_players() ]
-            state, _, _ = state.transition(moves, hidden_state)
-        total_payoff += state.terminal_value(hidden_state)[player]
+        total_payoff += rollout(root_state, hidden_state, select_opponent_move)[player]
     return total_payoff
 
 
@@ -186,7 +184,7 @@ class SingleMCTSPlayoutBot(Bot):
         self.game = game
         self.player = player
         self.role = role
-        self.hidden_states = hidden_states
+        self.belief = BeliefState.from_hidden_states(hidden_states)
         self.is_evil = role in EVIL_ROLES
 
 
@@ -195,11 +193,11 @@ class SingleMCTSPlayoutBot(Bot):
         if old_state.status == 'run':
             if move is not None and self.role in EVIL_ROLES and not move.fail:
                 observation += 1
-            self.hidden_states = filter_hidden_states(self.hidden_states, old_state.proposal, observation)
+            self.belief = self.belief.filter_mission(old_state.proposal, observation)
 
 
     def get_action(self, state, legal_actions):
-        return search_mcts(state, self.player, self.hidden_states)
+        return search_mcts(state, self.player, self.belief.hidden_states)
 
 
     def get_move_probabilities(self, state, legal_actions):
@@ -218,7 +216,7 @@ class SingleMCTSHeuristicBot(Bot):
         self.game = game
         self.player = player
         self.role = role
-        self.hidden_states = hidden_states
+        self.belief = BeliefState.from_hidden_states(hidden_states)
         self.is_evil = role in EVIL_ROLES
 
 
@@ -227,11 +225,11 @@ class SingleMCTSHeuristicBot(Bot):
         if old_state.status == 'run':
             if move is not None and self.role in EVIL_ROLES and not move.fail:
                 observation += 1
-            self.hidden_states = filter_hidden_states(self.hidden_states, old_state.proposal, observation)
+            self.belief = self.belief.filter_mission(old_state.proposal, observation)
 
 
     def get_action(self, state, legal_actions):
-        return search_mcts(state, self.player, self.hidden_states, node_value_func=heuristic_value_func)
+        return search_mcts(state, self.player, self.belief.hidden_states, node_value_func=heuristic_value_func)
 
 
     def get_move_probabilities(self, state, legal_actions):
@@ -249,7 +247,7 @@ class SingleMCTSBaseOpponentBot(Bot):
         self.game = game
         self.player = player
         self.role = role
-        self.hidden_states = hidden_states
+        self.belief = BeliefState.from_hidden_states(hidden_states)
         self.is_evil = role in EVIL_ROLES
 
 
@@ -264,6 +262,6 @@ class SingleMCTSBaseOpponentBot(Bot):
 
 
     def get_move_probabilities(self, state, legal_actions):
-        hidden_state = self.hidden_states[np.random.choice(len(self.hidden_states))]
+        hidden_state = self.belief.sample()
         _, probs = get_opponent_moves_and_probs(state, hidden_state, self.player, no_tremble=True)
         return probs
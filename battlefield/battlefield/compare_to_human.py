@@ -6,6 +6,7 @@ import pandas as pd
 
 from battlefield.avalon_types import GOOD_ROLES, EVIL_ROLES, possible_hidden_states, starting_hidden_states, ProposeAction, VoteAction, MissionAction, PickMerlinAction
 from battlefield.avalon import AvalonState
+from battlefield.bots.bot import share_game_context
 
 DATAFILE = os.path.abspath(os.path.join(os.path.dirname(__file__), 'bots', 'data', 'relabeled.json'))
 
@@ -159,6 +160,7 @@ def process_game(game, bot_class, stats, verbose=True, num_players=None, max_num
             bot_class.create_and_reset(state, player, role, perspectives[player])
             for player, role in enumerate(hidden_state)
         ]
+        share_game_context(bots)
         for round_ in game['log']:
             state = handle_round(game, state, hidden_state, bots, round_, stats)
     except AssertionError:
@@ -0,0 +1,351 @@
+"""
+A small cooperative scheduler, so one process can play many games while their bots wait on subprocesses.
+
+A coroutine is a generator. It can yield:
+ - another coroutine, to run it and get its result back,
+ - a SubprocessCall, to get the command's stdout back once it exits (other coroutines run meanwhile),
+ - a WorkerCall, to get a long-lived worker process's response to a request,
+ - Return(value), to finish with value. Finishing without one returns None.
+If a call fails, its exception is raised where it was yielded, in every coroutine waiting on it.
+"""
+import os
+import sys
+import types
+import struct
+import select
+import subprocess
+import multiprocessing
+from collections import deque
+
+# Python processes sharing this machine's cores, set with share_cores in each of them
+SHARING_PROCESSES = 1
+
+
+def share_cores(processes):
+    """
+    Tells this process that it is one of processes splitting the machine's cores, so the worker pools it
+    starts only use its share. Pass it as the initializer of a multiprocessing.Pool.
+    """
+    global SHARING_PROCESSES
+    SHARING_PROCESSES = processes
+
+
+def cores_per_process():
+    return max(1, multiprocessing.cpu_count() // SHARING_PROCESSES)
+
+
+class Return(object):
+    def __init__(self, value):
+        self.value = value
+
+
+class SubprocessCall(object):
+    """
+    Runs command with input on stdin. Any number of coroutines can yield the same call, and all of them get
+    its stdout. stderr is read and dropped, like communicate() does.
+    """
+    def __init__(self, command, input, cwd=None):
+        self.command = command
+        self.input = input
+        self.cwd = cwd
+        self.process = None
+        self.stdout = []
+        self.open_fds = set()
+        self.started = False
+        self.done = False
+        self.result = None
+
+
+    def start(self):
+        """
+        Starts the command, unless an earlier scheduler already did (and then gave up on it)
+        """
+        if self.started:
+            return
+        self.started = True
+        self.process = subprocess.Popen(
+            self.command,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            cwd=self.cwd
+        )
+        # Inputs are small enough to fit in the pipe buffer, so this never blocks
+        self.process.stdin.write(self.input)
+        self.process.stdin.close()
+        self.open_fds = set([self.process.stdout.fileno(), self.process.stderr.fileno()])
+
+
+    def read(self, fd):
+        data = os.read(fd, 1 << 16)
+        if data:
+            if fd == self.process.stdout.fileno():
+                self.stdout.append(data)
+            return
+        self.open_fds.remove(fd)
+        if len(self.open_fds) == 0:
+            self.process.wait()
+            self.process.stdout.close()
+            self.process.stderr.close()
+            self.result = ''.join(self.stdout)
+            self.stdout = []
+            self.done = True
+
+
+class FramedWorker(object):
+    """
+    A long-lived subprocess which answers each request on stdin with one response on stdout. Requests and
+    responses are framed as a 4 byte little-endian length followed by the payload.
+    """
+    def __init__(self, command, cwd=None):
+        with open(os.devnull, 'w') as devnull:
+            self.process = subprocess.Popen(
+                command,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=devnull,
+                cwd=cwd
+            )
+        self.stdin_fd = self.process.stdin.fileno()
+        self.stdout_fd = self.process.stdout.fileno()
+
+
+    def send(self, payload):
+        data = struct.pack('<I', len(payload)) + payload
+        try:
+            while len(data) > 0:
+                data = data[os.write(self.stdin_fd, data):]
+        except OSError:
+            # The worker exited. Its stdout is at EOF, so whoever reads the response finds out.
+            pass
+
+
+    def close(self):
+        self.process.stdin.close()
+        self.process.stdout.close()
+        self.process.wait()
+
+
+class WorkerPool(object):
+    """
+    Up to size FramedWorkers running command, started as they are needed. Calls wait for a free worker.
+    """
+    def __init__(self, command, size, cwd=None):
+        self.command = command
+        self.size = size
+        self.cwd = cwd
+        self.workers = []
+        self.free = []
+        self.queued = deque()
+
+
+    def call(self, payload):
+        return WorkerCall(self, payload)
+
+
+    def acquire(self, call):
+        if len(self.free) > 0:
+            call.begin(self.free.pop())
+        elif len(self.workers) < self.size:
+            worker = FramedWorker(self.command, cwd=self.cwd)
+            self.workers.append(worker)
+            call.begin(worker)
+        else:
+            self.queued.append(call)
+
+
+    def release(self, worker):
+        if len(self.queued) > 0:
+            self.queued.popleft().begin(worker)
+        else:
+            self.free.append(worker)
+
+
+    def discard(self, worker):
+        """
+        Drops a worker which exited, and starts another in its place for the next queued call
+        """
+        self.workers.remove(worker)
+        worker.close()
+        if len(self.queued) > 0:
+            self.acquire(self.queued.popleft())
+
+
+    def close(self):
+        for worker in self.workers:
+            worker.close()
+        self.workers = []
+        self.free = []
+
+
+class WorkerCall(object):
+    """
+    One request to a WorkerPool. Its result is the worker's response payload.
+    """
+    def __init__(self, pool, payload):
+        self.pool = pool
+        self.payload = payload
+        self.worker = None
+        self.response = []
+        self.response_size = 0
+        self.open_fds = set()
+        self.started = False
+        self.done = False
+        self.result = None
+
+
+    def start(self):
+        """
+        Sends the request (or queues it for a free worker), unless an earlier scheduler already did
+        """
+        if self.started:
+            return
+        self.started = True
+        self.pool.acquire(self)
+
+
+    def begin(self, worker):
+        self.worker = worker
+        worker.send(self.payload)
+        self.open_fds = set([worker.stdout_fd])
+
+
+    def read(self, fd):
+        data = os.read(fd, 1 << 16)
+        if not data:
+            self.open_fds = set()
+            self.pool.discard(self.worker)
+            raise RuntimeError("Worker {} exited".format(' '.join(self.pool.command)))
+        self.response.append(data)
+        self.response_size += len(data)
+        if self.response_size < 4:
+            return
+        response = ''.join(self.response)
+        self.response = [response]
+        length = struct.unpack('<I', response[:4])[0]
+        if len(response) < 4 + length:
+            return
+        assert len(response) == 4 + length, "Worker answered more than it was asked"
+        self.result = response[4:]
+        self.response = []
+        self.open_fds = set()
+        self.done = True
+        self.pool.release(self.worker)
+
+
+class Task(object):
+    def __init__(self, coroutine):
+        self.stack = [coroutine]
+        self.done = False
+        self.result = None
+
+
+class Scheduler(object):
+    def __init__(self):
+        self.waiting = {}
+
+
+    def step(self, task, value=None, error=None):
+        """
+        Runs task until it finishes or waits on a subprocess. error is an exc_info to raise in it instead of
+        sending it value.
+        """
+        while True:
+            try:
+                if error is not None:
+                    yielded = task.stack[-1].throw(*error)
+                    error = None
+                else:
+                    yielded = task.stack[-1].send(value)
+            except StopIteration:
+                yielded = Return(None)
+            except Exception:
+                # Raised into the coroutine that yielded this one, if there is one
+                task.stack.pop()
+                if len(task.stack) == 0:
+                    raise
+                error = sys.exc_info()
+                continue
+
+            if isinstance(yielded, Return):
+                task.stack.pop()
+                if len(task.stack) == 0:
+                    task.done = True
+                    task.result = yielded.value
+                    return
+                value = yielded.value
+            elif isinstance(yielded, types.GeneratorType):
+                task.stack.append(yielded)
+                value = None
+            elif isinstance(yielded, (SubprocessCall, WorkerCall)):
+                if yielded.done:
+                    value = yielded.result
+                    continue
+                if yielded not in self.waiting:
+                    try:
+                        yielded.start()
+                    except Exception:
+                        error = sys.exc_info()
+                        continue
+                    self.waiting[yielded] = []
+                self.waiting[yielded].append(task)
+                return
+            else:
+                raise TypeError("Coroutine yielded {!r}".format(yielded))
+
+
+    def wait(self):
+        """
+        Blocks until some subprocess has output, and resumes the tasks whose call finished
+        """
+        calls_by_fd = { fd: call for call in self.waiting for fd in call.open_fds }
+        if len(calls_by_fd) == 0:
+            # Only calls queued for a worker pool whose workers are all busy elsewhere: nothing would wake us
+            raise RuntimeError("Waiting on {} calls, none of which has a process running".format(len(self.waiting)))
+        readable, _, _ = select.select(calls_by_fd.keys(), [], [])
+        for fd in readable:
+            call = calls_by_fd[fd]
+            try:
+                call.read(fd)
+            except Exception:
+                error = sys.exc_info()
+                for task in self.waiting.pop(call):
+                    self.step(task, error=error)
+                continue
+            if call.done:
+                for task in self.waiting.pop(call):
+                    self.step(task, call.result)
+
+
+def run_concurrently(coroutines, max_concurrent=64):
+    """
+    Runs the coroutines in this process with at most max_concurrent in progress at once, and yields
+    their results as they finish
+    """
+    scheduler = Scheduler()
+    coroutines = iter(coroutines)
+    active = []
+    exhausted = False
+    while not exhausted or len(active) > 0:
+        while not exhausted and len(active) < max_concurrent:
+            try:
+                task = Task(next(coroutines))
+            except StopIteration:
+                exhausted = True
+                break
+            scheduler.step(task)
+            active.append(task)
+
+        if len(scheduler.waiting) > 0:
+            scheduler.wait()
+        for task in active:
+            if task.done:
+                yield task.result
+        active = [ task for task in active if not task.done ]
+
+
+def run_to_completion(coroutine):
+    """
+    Runs one coroutine, blocking on its subprocesses
+    """
+    return next(run_concurrently([coroutine]))
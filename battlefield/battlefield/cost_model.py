@@ -0,0 +1,94 @@
+import os
+import json
+import numpy as np
+from collections import Counter
+
+BOT_COSTS_FILE = 'tournaments/bot_costs.json'
+# Seconds per seat per game for a bot which has never been timed, when no bot has been. Otherwise an untimed
+# bot is assumed to cost as much as the most expensive timed one, and plays one game per unit until it's timed.
+DEFAULT_SEAT_COST = 0.01
+# Units of work are sized to take about this long, so cheap games are batched and expensive ones spread out
+TARGET_UNIT_SECONDS = 2.0
+MAX_GAMES_PER_UNIT = 256
+
+
+def combo_key(bot_names):
+    return ','.join('{}:{}'.format(name, count) for name, count in sorted(Counter(bot_names).items()))
+
+
+def parse_combo_key(key):
+    return { name: int(count) for name, count in (item.split(':') for item in key.split(',')) }
+
+
+class BotCostModel(object):
+    """
+    Estimates the wall clock seconds of a game as the sum of a per-seat cost for each bot in it. The costs are
+    fit (least squares, weighted by games) to the timed units of work of each combination of bots, and kept in
+    a JSON file so the next run starts out knowing them.
+    """
+    def __init__(self, filename=BOT_COSTS_FILE):
+        self.filename = filename
+        # combo key -> [games, seconds]
+        self.timings = {}
+        if filename is not None and os.path.exists(filename):
+            with open(filename, 'r') as f:
+                self.timings = json.load(f)['timings']
+        self.costs = None
+
+
+    def record(self, bot_names, num_games, seconds):
+        timing = self.timings.setdefault(combo_key(bot_names), [0, 0.0])
+        timing[0] += num_games
+        timing[1] += seconds
+        self.costs = None
+
+
+    def fit(self):
+        combos = [ (parse_combo_key(key), games, seconds) for key, (games, seconds) in self.timings.items() if games > 0 ]
+        names = sorted(set(name for counts, _, _ in combos for name in counts))
+        if len(combos) == 0:
+            return {}
+        A = np.array([ [ counts.get(name, 0) for name in names ] for counts, _, _ in combos ], dtype=np.float64)
+        y = np.array([ seconds / games for _, games, seconds in combos ])
+        w = np.sqrt([ games for _, games, _ in combos ])
+        solution = np.linalg.lstsq(A * w[:, np.newaxis], y * w, rcond=None)[0]
+        return { name: max(cost, 1e-7) for name, cost in zip(names, solution) }
+
+
+    def is_timed(self, bot_name):
+        if self.costs is None:
+            self.costs = self.fit()
+        return bot_name in self.costs
+
+
+    def seat_cost(self, bot_name):
+        if self.is_timed(bot_name):
+            return self.costs[bot_name]
+        return max(self.costs.values() + [DEFAULT_SEAT_COST])
+
+
+    def game_cost(self, bot_names):
+        return sum(self.seat_cost(name) for name in bot_names)
+
+
+    def unit_games(self, bot_names):
+        """
+        Games per unit of work for a game of bot_names. A bot that has never been timed could be far slower
+        than the others, so its games go one per unit until it is.
+        """
+        if not all(self.is_timed(name) for name in bot_names):
+            return 1
+        return games_per_unit(self.game_cost(bot_names))
+
+
+    def save(self):
+        if self.filename is None:
+            return
+        tmp_filename = self.filename + '.tmp'
+        with open(tmp_filename, 'w') as f:
+            json.dump({ 'timings': self.timings, 'costs': self.fit() }, f, indent=2, sort_keys=True)
+        os.rename(tmp_filename, self.filename)
+
+
+def games_per_unit(seconds_per_game):
+    return int(max(1, min(MAX_GAMES_PER_UNIT, TARGET_UNIT_SECONDS / seconds_per_game)))
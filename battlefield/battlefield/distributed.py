@@ -0,0 +1,215 @@
+import os
+import sys
+import time
+import Queue
+import traceback
+import multiprocessing
+from multiprocessing.managers import BaseManager
+
+from battlefield.tournament import all_combo_tasks, large_tournament_batch_helper, ChunkedResultWriter
+from battlefield.cost_model import BotCostModel
+from battlefield.trajectory import TrajectoryWriter
+from battlefield.ledger import JobLedger, parse_unit_key
+from battlefield.cooperative import share_cores
+
+# Only local workers can connect unless the coordinator is given a public address. The manager unpickles
+# whatever it is sent, so the authkey is all that keeps strangers from running code on the coordinator.
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 50123
+AUTHKEY_VARIABLE = 'AVALON_AUTHKEY'
+MAX_IN_FLIGHT = 400
+# A unit with no result this long after a worker took it is handed out again (its worker probably died): at
+# least TASK_TIMEOUT, or TASK_TIMEOUT_FACTOR times as long as the cost model expects it to take. Each resend
+# of a unit waits twice as long as the last, and a unit resent MAX_RESENDS times fails the job.
+TASK_TIMEOUT = 10 * 60
+TASK_TIMEOUT_FACTOR = 4
+MAX_RESENDS = 3
+# Seconds between scans for timed out units
+RESEND_CHECK_INTERVAL = 10
+
+
+class TournamentManager(BaseManager):
+    """
+    Serves two queues over TCP: units of work going out to workers, and their results coming back
+    """
+    pass
+
+
+def coordinator_authkey(authkey):
+    """
+    authkey, or the one in $AVALON_AUTHKEY, or a new random one (printed, for starting workers with)
+    """
+    authkey = authkey or os.environ.get(AUTHKEY_VARIABLE)
+    if not authkey:
+        authkey = os.urandom(16).encode('hex')
+        print "Start workers with {}={}".format(AUTHKEY_VARIABLE, authkey)
+    return authkey
+
+
+def worker_authkey(authkey):
+    authkey = authkey or os.environ.get(AUTHKEY_VARIABLE)
+    assert authkey, "Set ${} to the coordinator's authkey".format(AUTHKEY_VARIABLE)
+    return authkey
+
+
+def parse_address(address):
+    if ':' not in address:
+        return (address, DEFAULT_PORT)
+    host, port = address.rsplit(':', 1)
+    return (host, int(port))
+
+
+def unit_timeout(cost_model, task, task_timeout):
+    combo_name, unit, _ = task
+    _, _, num_games = parse_unit_key(unit)
+    return max(task_timeout, TASK_TIMEOUT_FACTOR * num_games * cost_model.game_cost(combo_name.split('-')))
+
+
+def run_coordinator(bots, roles, address=(DEFAULT_HOST, DEFAULT_PORT), authkey=None, games_per_matching=50, record=False, chunk_size=10000, job_id=None, max_in_flight=MAX_IN_FLIGHT, task_timeout=TASK_TIMEOUT, max_resends=MAX_RESENDS):
+    """
+    Same output as run_all_combos, but the games are played by workers (see run_worker) on any host that can
+    reach address. Results are written and units logged in the job ledger as they come back, so a killed
+    coordinator resumes with the same job_id. Workers can join or leave at any time: a unit without a result
+    after task_timeout (or longer, see unit_timeout) is sent again, waiting twice as long each time, up to
+    max_resends times.
+    Listens on localhost only by default: pass address=('0.0.0.0', port) to take workers from other hosts.
+    """
+    authkey = coordinator_authkey(authkey)
+    job_id = job_id or os.urandom(10).encode('hex')
+    ledger = JobLedger('tournaments/{}.ledger'.format(job_id))
+    print "Job {}: {} units already complete".format(job_id, len(ledger))
+    recorder = TrajectoryWriter('tournaments/{}.traj'.format(job_id)) if record else None
+    cost_model = BotCostModel()
+
+    task_queue = Queue.Queue()
+    result_queue = Queue.Queue()
+    TournamentManager.register('get_tasks', callable=lambda: task_queue)
+    TournamentManager.register('get_results', callable=lambda: result_queue)
+    manager = TournamentManager(address=address, authkey=authkey)
+    manager.start()
+    print "Coordinator listening on {}:{}".format(*manager.address)
+    tasks = manager.get_tasks()
+    results = manager.get_results()
+
+    writers = {}
+    # unit -> [task, position in the task queue, time a worker took it (None until then), times resent]
+    in_flight = {}
+    num_put = 0
+    last_check = time.time()
+    try:
+        pending = all_combo_tasks(bots, roles, games_per_matching, record, cost_model, ledger=ledger)
+        exhausted = False
+        while not exhausted or len(in_flight) > 0:
+            while not exhausted and len(in_flight) < max_in_flight:
+                try:
+                    task = next(pending)
+                except StopIteration:
+                    exhausted = True
+                    break
+                tasks.put(task)
+                in_flight[task[1]] = [task, num_put, None, 0]
+                num_put += 1
+
+            # Checked whether or not results keep coming, so a dead worker's units don't wait for the tail
+            now = time.time()
+            if now - last_check >= RESEND_CHECK_INTERVAL:
+                last_check = now
+                # Only this process puts tasks, and the queue is first in first out, so everything put before
+                # what's still queued has been taken by a worker. Units are timed from then, not from when
+                # they were queued behind max_in_flight others.
+                num_taken = num_put - tasks.qsize()
+                for unit, entry in in_flight.items():
+                    task, position, taken_at, resends = entry
+                    if taken_at is None:
+                        if position < num_taken:
+                            entry[2] = now
+                        continue
+                    if now - taken_at <= unit_timeout(cost_model, task, task_timeout) * 2**resends:
+                        continue
+                    if resends >= max_resends:
+                        raise RuntimeError("Unit {} got no result after being sent {} times".format(unit, resends + 1))
+                    print "Resending {}".format(unit)
+                    tasks.put(task)
+                    in_flight[unit] = [task, num_put, None, resends + 1]
+                    num_put += 1
+
+            try:
+                ok, combo_name, unit, value, seconds = results.get(True, RESEND_CHECK_INTERVAL)
+            except Queue.Empty:
+                continue
+
+            if not ok:
+                raise RuntimeError("Game failed in worker:\n{}".format(value))
+            if unit not in in_flight:
+                # A resent unit finished twice
+                continue
+            del in_flight[unit]
+
+            if combo_name not in writers:
+                writers[combo_name] = ChunkedResultWriter('tournaments/{}_{}'.format(combo_name, job_id), len(roles), chunk_size=chunk_size, ledger=ledger)
+            writers[combo_name].append_unit(unit, [ game_stat for game_stat, _, _ in value ])
+            cost_model.record(combo_name.split('-'), len(value), seconds)
+            if recorder is not None:
+                for _, trajectories, _ in value:
+                    recorder.extend(trajectories)
+
+        # Workers pass the stop marker on to each other, see run_worker
+        tasks.put(None)
+    finally:
+        # Units whose results came back are written (and logged) even if a game failed, so a resumed job
+        # doesn't play them again
+        for writer in writers.values():
+            writer.close()
+        cost_model.save()
+        ledger.close()
+        if recorder is not None:
+            recorder.close()
+        manager.shutdown()
+
+
+def worker_loop(address, authkey, processes):
+    share_cores(processes)
+    TournamentManager.register('get_tasks')
+    TournamentManager.register('get_results')
+    manager = TournamentManager(address=address, authkey=authkey)
+    manager.connect()
+    tasks = manager.get_tasks()
+    results = manager.get_results()
+    while True:
+        try:
+            task = tasks.get()
+        except (EOFError, IOError):
+            # The coordinator has gone away
+            return
+        if task is None:
+            try:
+                tasks.put(None)
+            except (EOFError, IOError):
+                pass
+            return
+        combo_name, unit, args_list = task
+        try:
+            _, value, seconds = large_tournament_batch_helper(unit, args_list)
+            results.put((True, combo_name, unit, value, seconds))
+        except Exception:
+            results.put((False, combo_name, unit, traceback.format_exc(), 0.0))
+
+
+def run_worker(address, authkey=None, processes=None):
+    """
+    Plays units of work from the coordinator at address on processes processes (one per core by default)
+    until the coordinator says the job is done. authkey defaults to $AVALON_AUTHKEY.
+    """
+    authkey = worker_authkey(authkey)
+    processes = processes or multiprocessing.cpu_count()
+    print "Worker connecting to {}:{} with {} processes".format(address[0], address[1], processes)
+    workers = [ multiprocessing.Process(target=worker_loop, args=(address, authkey, processes)) for _ in range(processes) ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+
+if __name__ == "__main__":
+    assert len(sys.argv) >= 2, "Usage: AVALON_AUTHKEY=<key> python -m battlefield.distributed host:port [processes]"
+    run_worker(parse_address(sys.argv[1]), processes=int(sys.argv[2]) if len(sys.argv) > 2 else None)
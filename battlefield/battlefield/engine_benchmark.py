@@ -0,0 +1,136 @@
+import os
+import sys
+import time
+import json
+import random
+import platform
+import subprocess
+
+from battlefield.avalon_types import enumerate_hidden_states, possible_hidden_states, starting_hidden_states, filter_hidden_states
+from battlefield.avalon import AvalonState
+from battlefield.bots.random_bot import RandomBot
+from battlefield.tournament import run_game
+
+PLAYER_COUNTS = range(5, 11)
+ROLES = ['merlin', 'assassin']
+MIN_SECONDS = 0.5
+NUM_WORKLOAD_GAMES = 200
+
+
+def calls_per_second(f, args_list, min_seconds=MIN_SECONDS):
+    """
+    Calls f(*args) for args in args_list, round after round, until min_seconds have passed
+    """
+    calls = 0
+    start = time.time()
+    while True:
+        for args in args_list:
+            f(*args)
+        calls += len(args_list)
+        elapsed = time.time() - start
+        if elapsed >= min_seconds:
+            return calls / elapsed
+
+
+def random_game_workload(num_players, hidden_states, num_games):
+    """
+    Plays random games and collects the (state, moves, hidden_state) of every transition, along with every
+    (state, player, hidden_state) legal_actions was asked for and the terminal states reached
+    """
+    transitions = []
+    legal_action_calls = []
+    terminal_states = []
+    for _ in range(num_games):
+        hidden_state = random.choice(hidden_states)
+        state = AvalonState.start_state(num_players)
+        while not state.is_terminal():
+            moves = []
+            for player in state.moving_players():
+                legal_action_calls.append((state, player, hidden_state))
+                moves.append(random.choice(state.legal_actions(player, hidden_state)))
+            transitions.append((state, moves, hidden_state))
+            state, _, _ = state.transition(moves, hidden_state)
+        terminal_states.append((state, hidden_state))
+    return transitions, legal_action_calls, terminal_states
+
+
+def benchmark_player_count(num_players):
+    """
+    Returns a dict of calls per second for each engine function, and the number of hidden states
+    """
+    result = {}
+
+    # Enumerated without the in memory or the on disk cache, so this times the engine itself
+    result['possible_hidden_states_cold'] = calls_per_second(enumerate_hidden_states, [(ROLES, num_players)])
+    result['possible_hidden_states'] = calls_per_second(possible_hidden_states, [(ROLES, num_players)])
+
+    hidden_states = possible_hidden_states(ROLES, num_players)
+
+    real_hidden_states = random.sample(hidden_states, min(20, len(hidden_states)))
+    result['starting_hidden_states'] = calls_per_second(starting_hidden_states, [
+        (player, real_hidden_state, hidden_states)
+        for real_hidden_state in real_hidden_states
+        for player in range(num_players)
+    ])
+
+    transitions, legal_action_calls, terminal_states = random_game_workload(num_players, hidden_states, NUM_WORKLOAD_GAMES)
+    missions = [ (state.proposal, random.randint(0, 2)) for state, _, _ in transitions if state.status == 'run' ][:20]
+    result['filter_hidden_states'] = calls_per_second(filter_hidden_states, [
+        (hidden_states, proposal, num_fails)
+        for proposal, num_fails in missions
+    ])
+    result['transition'] = calls_per_second(lambda state, moves, hidden_state: state.transition(moves, hidden_state), transitions)
+    result['legal_actions'] = calls_per_second(lambda state, player, hidden_state: state.legal_actions(player, hidden_state), legal_action_calls)
+    result['terminal_value'] = calls_per_second(lambda state, hidden_state: state.terminal_value(hidden_state), terminal_states)
+
+    start_state = AvalonState.start_state(num_players)
+    beliefs = {
+        real_hidden_state: [ starting_hidden_states(player, real_hidden_state, hidden_states) for player in range(num_players) ]
+        for real_hidden_state in real_hidden_states
+    }
+    def random_game(real_hidden_state):
+        bots = [
+            RandomBot.create_and_reset(start_state, player, role, beliefs[real_hidden_state][player])
+            for player, role in enumerate(real_hidden_state)
+        ]
+        return run_game(start_state, real_hidden_state, bots)
+    result['run_game_random_bots'] = calls_per_second(random_game, [ (h,) for h in real_hidden_states ])
+    return result, len(hidden_states)
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__))).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_engine_benchmarks(output_file=None, player_counts=PLAYER_COUNTS):
+    """
+    Measures engine throughput (calls per second) for each player count. Writes the results as JSON to output_file.
+    """
+    results = {
+        'timestamp': time.time(),
+        'git_revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'min_seconds': MIN_SECONDS,
+        'num_hidden_states': {},
+        'calls_per_second': {},
+    }
+    for num_players in player_counts:
+        print "Benchmarking {} players".format(num_players)
+        calls, num_hidden_states = benchmark_player_count(num_players)
+        results['calls_per_second'][str(num_players)] = calls
+        results['num_hidden_states'][str(num_players)] = num_hidden_states
+        for name, value in sorted(calls.items()):
+            print "{: >30}: {:.1f}".format(name, value)
+
+    if output_file is not None:
+        with open(output_file, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    return results
+
+
+if __name__ == "__main__":
+    run_engine_benchmarks(sys.argv[1] if len(sys.argv) > 1 else 'engine_benchmark.json')
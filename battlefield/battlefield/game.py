@@ -1,4 +1,6 @@
-class GameState:
+class GameState(object):
+    # Empty, so subclasses which declare __slots__ really have no per-instance __dict__
+    __slots__ = ()
     NUM_PLAYERS = 0
     HIDDEN_STATES = []
 
@@ -0,0 +1,69 @@
+import time
+import gzip
+import pandas as pd
+
+COLUMNS = ['bot', 'seat', 'role', 'call', 'status', 'wall', 'cpu']
+PERCENTILES = [0.5, 0.95, 0.99]
+
+
+class LatencyRecorder(object):
+    """
+    Wall clock and CPU seconds of every bot call run_game makes, tagged with the bot class, seat, role, which
+    call it was (get_action or handle_transition) and the status of the state it was made from
+    """
+    def __init__(self):
+        self.columns = { column: [] for column in COLUMNS }
+
+
+    def call(self, bot_name, seat, role, call, status, func, *args, **kwargs):
+        start_wall = time.time()
+        start_cpu = time.clock()
+        result = func(*args, **kwargs)
+        cpu = time.clock() - start_cpu
+        wall = time.time() - start_wall
+        columns = self.columns
+        columns['bot'].append(bot_name)
+        columns['seat'].append(seat)
+        columns['role'].append(role)
+        columns['call'].append(call)
+        columns['status'].append(status)
+        columns['wall'].append(wall)
+        columns['cpu'].append(cpu)
+        return result
+
+
+    def extend(self, other):
+        for column in COLUMNS:
+            self.columns[column].extend(other.columns[column])
+
+
+    def __len__(self):
+        return len(self.columns['wall'])
+
+
+    def to_dataframe(self):
+        df = pd.DataFrame(self.columns, columns=COLUMNS)
+        for column in ['bot', 'role', 'call', 'status']:
+            df[column] = df[column].astype('category')
+        return df
+
+
+    def write(self, filename):
+        print "Writing {}".format(filename)
+        with gzip.open(filename, 'w') as f:
+            self.to_dataframe().to_msgpack(f)
+
+
+def latency_summary(df, by=('bot', 'call', 'status')):
+    """
+    Calls, total seconds and the p50/p95/p99 latency of each group of calls in a LatencyRecorder DataFrame
+    """
+    grouped = df.groupby(list(by), observed=True)
+    summary = pd.concat([
+        grouped['wall'].count().rename('calls'),
+        grouped['wall'].sum().rename('wall_total'),
+        grouped['cpu'].sum().rename('cpu_total'),
+        grouped['wall'].quantile(PERCENTILES).unstack().rename(columns=lambda q: 'wall_p{}'.format(int(q * 100))),
+        grouped['cpu'].quantile(PERCENTILES).unstack().rename(columns=lambda q: 'cpu_p{}'.format(int(q * 100))),
+    ], axis=1)
+    return summary.sort_values('wall_total', ascending=False)
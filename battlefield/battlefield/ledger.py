@@ -0,0 +1,77 @@
+import os
+from collections import defaultdict
+
+
+def matching_key(hidden_state, bot_order_names):
+    return '{}|{}'.format(','.join(hidden_state), ','.join(bot_order_names))
+
+
+def unit_key(hidden_state, bot_order_names, first_game, num_games):
+    """
+    Names one unit of tournament work: a run of games of one matching
+    """
+    return '{}|{}+{}'.format(matching_key(hidden_state, bot_order_names), first_game, num_games)
+
+
+def parse_unit_key(unit):
+    """
+    Returns (matching key, first game, number of games)
+    """
+    matching, games = unit.rsplit('|', 1)
+    first_game, num_games = games.split('+')
+    return matching, int(first_game), int(num_games)
+
+
+class JobLedger(object):
+    """
+    An append-only record of the units of work a tournament job has finished. A unit is only marked once its
+    results are on disk, so re-running a killed job with the same ledger skips exactly the finished units.
+    Finished games are also tracked per matching, so a re-run can skip them even if it splits games into
+    units differently.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self.completed = set()
+        self.games = defaultdict(set)
+        committed_size = 0
+        if os.path.exists(filename):
+            with open(filename, 'r') as f:
+                for line in f:
+                    # A torn last line means that unit was never committed
+                    if line.endswith('\n'):
+                        self.add(line[:-1])
+                        committed_size += len(line)
+        self.f = open(filename, 'a')
+        self.f.truncate(committed_size)
+
+
+    def add(self, unit):
+        self.completed.add(unit)
+        matching, first_game, num_games = parse_unit_key(unit)
+        self.games[matching].update(range(first_game, first_game + num_games))
+
+
+    def is_complete(self, unit):
+        return unit in self.completed
+
+
+    def completed_games(self, hidden_state, bot_order_names):
+        return self.games.get(matching_key(hidden_state, bot_order_names), set())
+
+
+    def mark_complete(self, units):
+        if len(units) == 0:
+            return
+        self.f.write(''.join(unit + '\n' for unit in units))
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        for unit in units:
+            self.add(unit)
+
+
+    def __len__(self):
+        return len(self.completed)
+
+
+    def close(self):
+        self.f.close()
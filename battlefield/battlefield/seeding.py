@@ -0,0 +1,111 @@
+import random
+import hashlib
+import numpy as np
+
+Z_95 = 1.96
+
+
+def derive_seed(*args):
+    """
+    A 32 bit seed for args, the same in every process and every run
+    """
+    return int(hashlib.md5(repr(args)).hexdigest()[:8], 16)
+
+
+def game_seed(base_seed, hidden_state, game):
+    """
+    The seed of the game-th game of a hidden state. It doesn't depend on the bots, so two runs with the same
+    base_seed play the same games with whichever bots are seated.
+    """
+    return derive_seed('game', base_seed, tuple(hidden_state), game)
+
+
+class SeededBot(object):
+    """
+    Wraps a bot so everything it draws from the global random and np.random comes from its own stream, seeded
+    by (game seed, seat). A seat sees the same random numbers no matter what the other seats draw, so replaying
+    a game seed with one bot swapped keeps every other seat's randomness the same.
+    """
+    def __init__(self, bot, seed, seat):
+        self.bot = bot
+        seat_seed = derive_seed('seat', seed, seat)
+        self.py_state = random.Random(seat_seed).getstate()
+        self.np_state = np.random.RandomState(seat_seed).get_state()
+
+
+    def call(self, func, *args, **kwargs):
+        outer_py_state = random.getstate()
+        outer_np_state = np.random.get_state()
+        random.setstate(self.py_state)
+        np.random.set_state(self.np_state)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.py_state = random.getstate()
+            self.np_state = np.random.get_state()
+            random.setstate(outer_py_state)
+            np.random.set_state(outer_np_state)
+
+
+    def get_action(self, state, legal_actions):
+        return self.call(self.bot.get_action, state, legal_actions)
+
+
+    def handle_transition(self, old_state, new_state, observation, move=None):
+        return self.call(self.bot.handle_transition, old_state, new_state, observation, move=move)
+
+
+    def set_game_context(self, context):
+        self.bot.set_game_context(context)
+
+
+def seeded_bot(seed, seat, create_bot, *args):
+    """
+    A SeededBot around create_bot(*args), which runs in the seat's stream too. Bots which draw random numbers
+    in reset() (e.g. LearningBot's training) need creating this way for a seed to replay their game exactly.
+    """
+    seeded = SeededBot(None, seed, seat)
+    seeded.bot = seeded.call(create_bot, *args)
+    return seeded
+
+
+def seeded_bots(bots, seed):
+    """
+    Wraps each bot that isn't a SeededBot yet in its seat's stream
+    """
+    return [ bot if isinstance(bot, SeededBot) else SeededBot(bot, seed, seat) for seat, bot in enumerate(bots) ]
+
+
+def unwrap_bot(bot):
+    return bot.bot if isinstance(bot, SeededBot) else bot
+
+
+def bot_game_payoffs(df, bot_name):
+    """
+    The mean payoff of bot_name's seats in each game of a seeded tournament DataFrame, indexed by
+    (seed, the seats bot_name sat in)
+    """
+    num_players = len([ c for c in df.columns if c.endswith('_payoff') ])
+    is_bot = np.array([ (df['bot_{}'.format(p)] == bot_name).values for p in range(num_players) ]).T
+    payoffs = np.array([ df['bot_{}_payoff'.format(p)].values for p in range(num_players) ]).T
+    counts = np.sum(is_bot, axis=1)
+    keep = counts > 0
+    seats = [ tuple(np.flatnonzero(row)) for row in is_bot[keep] ]
+    result = {}
+    for seed, seat, payoff in zip(df['seed'].values[keep], seats, (np.sum(payoffs * is_bot, axis=1) / np.maximum(counts, 1))[keep]):
+        result[(seed, seat)] = payoff
+    return result
+
+
+def paired_difference(df_a, bot_a, df_b, bot_b, z=Z_95):
+    """
+    Compares bot_a in tournament df_a with bot_b in tournament df_b, both run with the same base seed and bot_b
+    in bot_a's place. Games are paired on (game seed, seats), so the luck they share cancels out.
+    Returns (mean payoff difference, confidence interval half width, paired games).
+    """
+    payoffs_a = bot_game_payoffs(df_a, bot_a)
+    payoffs_b = bot_game_payoffs(df_b, bot_b)
+    keys = [ key for key in payoffs_a if key in payoffs_b ]
+    assert len(keys) > 1, "Need at least two paired games, were both tournaments run with the same seed?"
+    differences = np.array([ payoffs_a[key] - payoffs_b[key] for key in keys ])
+    return np.mean(differences), z * np.std(differences, ddof=1) / np.sqrt(len(differences)), len(differences)
@@ -6,6 +6,7 @@ from collections import defaultdict
 
 from battlefield.avalon_types import GOOD_ROLES, EVIL_ROLES, possible_hidden_states, starting_hidden_states, ProposeAction, VoteAction, MissionAction, PickMerlinAction
 from battlefield.avalon import AvalonState
+from battlefield.zobrist import extend_history_hash
 from battlefield.bots import SimpleStatsBot, ObserveBot, RandomBot, HumanLikeBot
 from battlefield.bots.observe_beater_bot import get_python_perspective
 
@@ -118,12 +119,10 @@ def get_action_index(strat):
     return len(strat) - 1
 
 
-def subgame_cfr(state, hidden_state, perspectives, me, regrets, strats, observations, strategy_probability, t):
+def subgame_cfr(state, hidden_state, perspectives, me, regrets, strats, history_hash, strategy_probability, t):
     if state.is_terminal():
         return state.terminal_value(hidden_state)[me]
 
-    observation_history = tuple(observations)
-
     moving_players = state.moving_players()
     my_move_index = None
     moves = [None] * len(moving_players)
@@ -142,52 +141,45 @@ def subgame_cfr(state, hidden_state, perspectives, me, regrets, strats, observat
             my_move_index = i
             continue
         
-        move_probs = calculate_strategy(regrets[state.status][(perspective, observation_history)])
+        move_probs = calculate_strategy(regrets[state.status][(perspective, history_hash)])
         legal_actions = state.legal_actions(player, hidden_state)
         moves[i] = legal_actions[get_action_index(move_probs)]
 
 
     if my_move_index is None:
-        new_state, _, observation = state.transition(moves, hidden_state)
-        if state.status == 'vote':
-            observation = tuple([vote.up for vote in observation])
-        observations.append(observation)
-        value = subgame_cfr(new_state, hidden_state, perspectives, me, regrets, strats, observations, strategy_probability, t)
-        observations.pop()
+        new_state, _, observation = state.transition_unchecked(moves, hidden_state)
+        new_history_hash = extend_history_hash(history_hash, state, observation)
+        value = subgame_cfr(new_state, hidden_state, perspectives, me, regrets, strats, new_history_hash, strategy_probability, t)
         return value
 
 
     perspective = perspectives[me]
-    p = calculate_strategy(regrets[state.status][(perspective, observation_history)])
+    p = calculate_strategy(regrets[state.status][(perspective, history_hash)])
 
     values = np.zeros(len(p))
 
     legal_actions = state.legal_actions(me, hidden_state)
     for action_index in range(len(values)):
         moves[my_move_index] = legal_actions[action_index]
-        new_state, _, observation = state.transition(moves, hidden_state)
-        if state.status == 'vote':
-            observation = tuple([vote.up for vote in observation])
-        observations.append(observation)
-        values[action_index] = subgame_cfr(new_state, hidden_state, perspectives, me, regrets, strats, observations, strategy_probability * p[action_index], t)
-        observations.pop()
+        new_state, _, observation = state.transition_unchecked(moves, hidden_state)
+        new_history_hash = extend_history_hash(history_hash, state, observation)
+        values[action_index] = subgame_cfr(new_state, hidden_state, perspectives, me, regrets, strats, new_history_hash, strategy_probability * p[action_index], t)
 
     strategy_value = np.dot(values, p)
     new_regrets = values - strategy_value
-    key = (perspective, observation_history)
+    key = (perspective, history_hash)
     regrets[state.status][key] += new_regrets * t
     strats[state.status][key] += p * strategy_probability * t
     return strategy_value
 
 
-def get_player_values(hidden_state, state, perspectives, observations, strats, probability):
+def get_player_values(hidden_state, state, perspectives, history_hash, strats, probability):
     if probability < 0.000000001:
         return np.zeros(len(hidden_state))
 
     if state.is_terminal():
         return probability * np.array(state.terminal_value(hidden_state))
 
-    observation_history = tuple(observations)
     moving_players = state.moving_players()
 
     unnormalized_strats = [
@@ -196,7 +188,7 @@ def get_player_values(hidden_state, state, perspectives, observations, strats, p
             if hidden_state[player] not in EVIL_ROLES and state.status == 'run' else
             np.array([1.0, 0, 0, 0, 0])
             if hidden_state[player] != 'assassin' and state.status == 'merlin' else
-            strats[state.status][(perspectives[player], observation_history)]
+            strats[state.status][(perspectives[player], history_hash)]
         ) for player in moving_players
     ]
     normalized_strats = [ strat / np.sum(strat) if np.sum(strat) != 0 else np.ones(len(strat)) / len(strat) for strat in unnormalized_strats ]
@@ -219,16 +211,13 @@ def get_player_values(hidden_state, state, perspectives, observations, strats, p
             new_state = transition_cache
             observation = moves
         else:
-            new_state, _, observation = state.transition(moves, hidden_state)
+            new_state, _, observation = state.transition_unchecked(moves, hidden_state)
 
         if transition_cache is None:
             transition_cache = new_state
 
-        if state.status == 'vote':
-            observation = tuple([vote.up for vote in observation])
-        observations.append(observation)
-        values += get_player_values(hidden_state, new_state, perspectives, observations, strats, p * probability)
-        observations.pop()
+        new_history_hash = extend_history_hash(history_hash, state, observation)
+        values += get_player_values(hidden_state, new_state, perspectives, new_history_hash, strats, p * probability)
     return values
 
 
@@ -242,7 +231,7 @@ def get_player_values_for_state(hidden_states, probs, state, strats):
         perspectives = [
             get_python_perspective(hidden_state, player) for player in range(5)
         ]
-        player_values_in_state[h] = get_player_values(hidden_state, state, perspectives, [], strats, 1.0)
+        player_values_in_state[h] = get_player_values(hidden_state, state, perspectives, 0, strats, 1.0)
     return player_values_in_state
 
 
@@ -294,7 +283,7 @@ def solve_subgame(hidden_states, lls, state, iterations=1000):
             get_python_perspective(hidden_state, player) for player in range(5)
         ]
         for player in range(5):
-            subgame_cfr(state, hidden_state, perspectives, player, regrets, strats, [], 1.0, t + 1.0)
+            subgame_cfr(state, hidden_state, perspectives, player, regrets, strats, 0, 1.0, t + 1.0)
 
     print "Retreiving player values..."
     player_values_in_state = get_player_values_for_state(hidden_states, probs, state, strats)
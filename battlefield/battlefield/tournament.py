@@ -4,68 +4,146 @@ import multiprocessing
 import gzip
 import random
 import os
-from collections import defaultdict
+import glob
+import traceback
+import math
+import time
+from collections import defaultdict, Counter
 
-from battlefield.avalon_types import GOOD_ROLES, EVIL_ROLES, possible_hidden_states, starting_hidden_states
+from battlefield.avalon_types import GOOD_ROLES, EVIL_ROLES, possible_hidden_states, starting_hidden_states, multiset_permutations
 from battlefield.avalon import AvalonState
-
-def run_game(state, hidden_state, bots):
+from battlefield.vectorized import VectorizedAvalonEnv, batched_policy_for
+from battlefield.trajectory import Trajectory, TrajectoryWriter
+from battlefield.ledger import JobLedger, unit_key, parse_unit_key
+from battlefield.latency import LatencyRecorder
+from battlefield.seeding import game_seed, seeded_bot, seeded_bots, unwrap_bot
+from battlefield.cooperative import Return, run_concurrently, share_cores
+from battlefield.bots.bot import share_game_context
+from battlefield.cost_model import BotCostModel
+
+def run_game(state, hidden_state, bots, recorder=None, timer=None, seed=None):
+    """
+    Plays a game to the end. If recorder is given (a TrajectoryWriter, or any list), the game's
+    Trajectory is appended to it. If timer is given (a LatencyRecorder), every bot call is timed.
+    If seed is given, each seat draws random numbers from its own stream seeded by (seed, seat), so the
+    game can be replayed exactly (see battlefield.seeding). Bots should then be created with create_game_bots
+    (or seeding.seeded_bot), so their resets draw from those streams too.
+    """
+    bot_names = [ unwrap_bot(bot).__class__.__name__ for bot in bots ]
+    trajectory = None if recorder is None else Trajectory(hidden_state, bot_names, seed=seed or 0)
+    share_game_context(bots)
+    if seed is not None:
+        bots = seeded_bots(bots, seed)
     while not state.is_terminal():
         moving_players = state.moving_players()
-        moves = [
-            bots[player].get_action(state, state.legal_actions(player, hidden_state))
-            for player in moving_players
-        ]
+        if timer is None:
+            moves = [
+                bots[player].get_action(state, state.legal_actions(player, hidden_state))
+                for player in moving_players
+            ]
+        else:
+            moves = [
+                timer.call(bot_names[player], player, hidden_state[player], 'get_action', state.status, bots[player].get_action, state, state.legal_actions(player, hidden_state))
+                for player in moving_players
+            ]
         new_state, _, observation = state.transition(moves, hidden_state)
+        if trajectory is not None:
+            trajectory.add(state, moves, observation)
         for player, bot in enumerate(bots):
             if player in moving_players:
                 move = moves[moving_players.index(player)]
             else:
                 move = None
-            bot.handle_transition(state, new_state, observation, move=move)
+            if timer is None:
+                bot.handle_transition(state, new_state, observation, move=move)
+            else:
+                timer.call(bot_names[player], player, hidden_state[player], 'handle_transition', state.status, bot.handle_transition, state, new_state, observation, move=move)
         state = new_state
+    if trajectory is not None:
+        trajectory.finish(state.game_end)
+        recorder.append(trajectory)
     return state.terminal_value(hidden_state), state.game_end
 
 
 
-def run_large_tournament(bots_classes, roles, games_per_matching=50):
-    print "Running {}".format(' '.join(map(lambda c: c.__name__, bots_classes)))
+def run_game_coroutine(state, hidden_state, bots):
+    """
+    run_game as a coroutine (see battlefield.cooperative): bots which wait on subprocesses let other games
+    run meanwhile
+    """
+    share_game_context(bots)
+    while not state.is_terminal():
+        moving_players = state.moving_players()
+        moves = []
+        for player in moving_players:
+            move = yield bots[player].get_action_coroutine(state, state.legal_actions(player, hidden_state))
+            moves.append(move)
+        new_state, _, observation = state.transition(moves, hidden_state)
+        for player, bot in enumerate(bots):
+            if player in moving_players:
+                move = moves[moving_players.index(player)]
+            else:
+                move = None
+            yield bot.handle_transition_coroutine(state, new_state, observation, move=move)
+        state = new_state
+    yield Return((state.terminal_value(hidden_state), state.game_end))
+
+
+def cooperative_game(bot_order, hidden_state, beliefs, start_state):
+    bots = [ bot_cls() for bot_cls in bot_order ]
+    for player, (bot, role) in enumerate(zip(bots, hidden_state)):
+        yield bot.reset_coroutine(start_state, player, role, beliefs[player])
+    values, game_end = yield run_game_coroutine(start_state, hidden_state, bots)
+    game_stat = {
+        'winner': game_end[0],
+        'win_type': game_end[1],
+    }
+    for player, (bot_cls, role) in enumerate(zip(bot_order, hidden_state)):
+        game_stat['bot_{}'.format(player)] = bot_cls.__name__
+        game_stat['bot_{}_role'.format(player)] = role
+        game_stat['bot_{}_payoff'.format(player)] = values[player]
+    yield Return(game_stat)
+
+
+def run_cooperative_tournament(bots_classes, roles, games_per_matching=50, max_concurrent_games=64):
+    """
+    Same output as run_large_tournament, but up to max_concurrent_games games are in progress at once in this
+    process. While a game waits on a bot's subprocess (e.g. a Deeprole solve), the others move on, so one
+    process keeps many solver subprocesses busy.
+    """
+    print "Running cooperative {}".format(' '.join(map(lambda c: c.__name__, bots_classes)))
 
     start_state = AvalonState.start_state(len(roles))
-    result = []
-    all_hidden_states = possible_hidden_states(set(roles), num_players=len(roles))
+    games = (
+        cooperative_game(bot_order, hidden_state, beliefs, start_state)
+        for hidden_state, bot_order, _, beliefs in tournament_matchings(bots_classes, roles)
+        for _ in range(games_per_matching)
+    )
+    result = list(run_concurrently(games, max_concurrent=max_concurrent_games))
+    return results_to_dataframe(result, len(roles))
 
-    seen_hidden_states = set([])
-    for hidden_state in itertools.permutations(roles):
-        if hidden_state in seen_hidden_states:
-            continue
-        seen_hidden_states.add(hidden_state)
 
-        beliefs = [
-            starting_hidden_states(player, hidden_state, all_hidden_states) for player in range(len(hidden_state))
-        ]
-        seen_bot_orders = set([])
-        for bot_order in itertools.permutations(bots_classes):
-            bot_order_str = tuple([bot_cls.__name__ for bot_cls in bot_order])
-            if bot_order_str in seen_bot_orders:
-                continue
-            seen_bot_orders.add(bot_order_str)
-
-            for _ in range(games_per_matching):
-                bots = [
-                    bot_cls.create_and_reset(start_state, player, role, beliefs[player])
-                    for player, (bot_cls, role) in enumerate(zip(bot_order, hidden_state))
-                ]
-                values, game_end = run_game(start_state, hidden_state, bots)
-                game_stat = {
-                    'winner': game_end[0],
-                    'win_type': game_end[1],
-                }
-                for player, (bot_cls, role) in enumerate(zip(bot_order, hidden_state)):
-                    game_stat['bot_{}'.format(player)] = bot_cls.__name__
-                    game_stat['bot_{}_role'.format(player)] = role
-                    game_stat['bot_{}_payoff'.format(player)] = values[player]
-                result.append(game_stat)
+def run_large_tournament(bots_classes, roles, games_per_matching=50, recorder=None, timer=None, seed=None):
+    print "Running {}".format(' '.join(map(lambda c: c.__name__, bots_classes)))
+
+    start_state = AvalonState.start_state(len(roles))
+    result = []
+    for hidden_state, bot_order, _, beliefs in tournament_matchings(bots_classes, roles):
+        for game in range(games_per_matching):
+            this_game_seed = None if seed is None else game_seed(seed, hidden_state, game)
+            bots = create_game_bots(create_and_reset_bot, bot_order, hidden_state, beliefs, start_state, this_game_seed)
+            values, game_end = run_game(start_state, hidden_state, bots, recorder=recorder, timer=timer, seed=this_game_seed)
+            game_stat = {
+                'winner': game_end[0],
+                'win_type': game_end[1],
+            }
+            if this_game_seed is not None:
+                game_stat['seed'] = this_game_seed
+            for player, (bot_cls, role) in enumerate(zip(bot_order, hidden_state)):
+                game_stat['bot_{}'.format(player)] = bot_cls.__name__
+                game_stat['bot_{}_role'.format(player)] = role
+                game_stat['bot_{}_payoff'.format(player)] = values[player]
+            result.append(game_stat)
 
     df = pd.DataFrame(result, columns=sorted(result[0].keys()))
     df['winner'] = df['winner'].astype('category')
@@ -77,56 +155,342 @@ def run_large_tournament(bots_classes, roles, games_per_matching=50):
     return df
 
 
-def large_tournament_parallel_helper(bot_order, hidden_state, beliefs, start_state):
-    bots = [
-        bot_cls.create_and_reset(start_state, player, role, beliefs[player])
-        for player, (bot_cls, role) in enumerate(zip(bot_order, hidden_state))
-    ]
-    values, game_end = run_game(start_state, hidden_state, bots)
+# REUSABLE bots built in this process, keyed on (bot name, seat), so a worker only pays their startup cost once
+WORKER_BOTS = {}
+
+def get_worker_bot(bot_cls, player):
+    key = (bot_cls.__name__, player)
+    if key not in WORKER_BOTS:
+        WORKER_BOTS[key] = bot_cls()
+    return WORKER_BOTS[key]
+
+
+def reset_worker_bot(bot_cls, game, player, role, hidden_states):
+    """
+    A bot reset for a new game: this worker's instance for the seat if bot_cls is REUSABLE, a new one otherwise
+    """
+    if not getattr(bot_cls, 'REUSABLE', False):
+        return bot_cls.create_and_reset(game, player, role, hidden_states)
+    bot = get_worker_bot(bot_cls, player)
+    bot.reset(game, player, role, hidden_states)
+    return bot
+
+
+def create_and_reset_bot(bot_cls, game, player, role, hidden_states):
+    return bot_cls.create_and_reset(game, player, role, hidden_states)
+
+
+def create_game_bots(create_bot, bot_order, hidden_state, beliefs, start_state, seed=None):
+    """
+    Calls create_bot(bot_cls, start_state, player, role, beliefs) for every seat. With a seed, each call runs in
+    its seat's random stream and the bot comes back as a SeededBot.
+    """
+    bots = []
+    for player, (bot_cls, role) in enumerate(zip(bot_order, hidden_state)):
+        args = (bot_cls, start_state, player, role, beliefs[player])
+        if seed is None:
+            bots.append(create_bot(*args))
+        else:
+            bots.append(seeded_bot(seed, player, create_bot, *args))
+    return bots
+
+
+def large_tournament_parallel_helper(bot_order, hidden_state, beliefs, start_state, record=False, timed=False, seed=None):
+    bots = create_game_bots(reset_worker_bot, bot_order, hidden_state, beliefs, start_state, seed)
+    trajectories = [] if record else None
+    timer = LatencyRecorder() if timed else None
+    values, game_end = run_game(start_state, hidden_state, bots, recorder=trajectories, timer=timer, seed=seed)
     game_stat = {
         'winner': game_end[0],
         'win_type': game_end[1],
     }
+    if seed is not None:
+        game_stat['seed'] = seed
     for player, (bot_cls, role) in enumerate(zip(bot_order, hidden_state)):
         game_stat['bot_{}'.format(player)] = bot_cls.__name__
         game_stat['bot_{}_role'.format(player)] = role
         game_stat['bot_{}_payoff'.format(player)] = values[player]
 
-    return game_stat
+    return game_stat, trajectories, timer
 
 
-def run_large_tournament_parallel(pool, bots_classes, roles, games_per_matching=50):
-    print "Running {}".format(' '.join(map(lambda c: c.__name__, bots_classes)))
+def large_tournament_batch_helper(unit, args_list):
+    start = time.time()
+    results = [ large_tournament_parallel_helper(*args) for args in args_list ]
+    return unit, results, time.time() - start
 
-    start_state = AvalonState.start_state(len(roles))
-    async_results = []
-    all_hidden_states = possible_hidden_states(set(roles), num_players=len(roles))
 
-    seen_hidden_states = set([])
-    for hidden_state in itertools.permutations(roles):
-        if hidden_state in seen_hidden_states:
-            continue
-        seen_hidden_states.add(hidden_state)
+def combo_batch_helper(combo_name, unit, args_list):
+    return (combo_name,) + large_tournament_batch_helper(unit, args_list)
+
+
+# Seat 0 always proposes first, so seats are not interchangeable (rotating a game gives a different game).
+# The only symmetry is relabeling identical roles or identical bots, so a matching is its sequence of role
+# names and bot names. Every matching stands for the same number of seat permutations
+# (orbit_size(roles) * orbit_size(bot names)), so playing each one equally often is unbiased.
+
+def orbit_size(items):
+    """
+    How many orderings of items give the same sequence: the product of the factorials of each item's count
+    """
+    return reduce(lambda a, b: a * b, (math.factorial(count) for count in Counter(items).values()), 1)
+
+
+def distinct_bot_orders(bots_classes):
+    """
+    Yields (bot_order, bot_order_str) for every distinct seating of bots_classes, without enumerating all
+    orderings of them
+    """
+    bots_by_name = { bot_cls.__name__: bot_cls for bot_cls in bots_classes }
+    for bot_order_str in multiset_permutations([bot_cls.__name__ for bot_cls in bots_classes]):
+        yield tuple(bots_by_name[name] for name in bot_order_str), bot_order_str
+
 
+def tournament_matchings(bots_classes, roles):
+    """
+    Yields (hidden_state, bot_order, bot_order_str, beliefs) for every distinct matching of bots to roles
+    """
+    all_hidden_states = possible_hidden_states(set(roles), num_players=len(roles))
+    bot_orders = list(distinct_bot_orders(bots_classes))
+    for hidden_state in multiset_permutations(roles):
         beliefs = [
             starting_hidden_states(player, hidden_state, all_hidden_states) for player in range(len(hidden_state))
         ]
-        seen_bot_orders = set([])
-        for bot_order in itertools.permutations(bots_classes):
-            bot_order_str = tuple([bot_cls.__name__ for bot_cls in bot_order])
-            if bot_order_str in seen_bot_orders:
+        for bot_order, bot_order_str in bot_orders:
+            yield hidden_state, bot_order, bot_order_str, beliefs
+
+
+def contiguous_runs(games, max_length):
+    """
+    Splits a sorted list of game indices into (first game, number of games) runs of consecutive games
+    """
+    runs = []
+    for game in games:
+        if len(runs) > 0 and sum(runs[-1]) == game and runs[-1][1] < max_length:
+            runs[-1][1] += 1
+        else:
+            runs.append([game, 1])
+    return runs
+
+
+GAMES_PER_BATCH = 16
+def large_tournament_tasks(bots_classes, roles, games_per_matching, record, ledger=None, timed=False, seed=None, games_per_unit=GAMES_PER_BATCH):
+    """
+    Lazily yields the arguments to large_tournament_batch_helper for every game of the tournament. Games of
+    the same matching are batched, up to games_per_unit at a time, so a worker plays them back to back with
+    the same bots. Each batch is a unit of work, and games the ledger has already finished are skipped.
+    With a seed, every game gets its own seed from game_seed.
+    """
+    start_state = AvalonState.start_state(len(roles))
+    for hidden_state, bot_order, bot_order_str, beliefs in tournament_matchings(bots_classes, roles):
+        games = range(games_per_matching)
+        if ledger is not None:
+            finished = ledger.completed_games(hidden_state, bot_order_str)
+            games = [ game for game in games if game not in finished ]
+        for first_game, num_games in contiguous_runs(games, games_per_unit):
+            unit = unit_key(hidden_state, bot_order_str, first_game, num_games)
+            yield (unit, [
+                (bot_order, hidden_state, beliefs, start_state, record, timed, None if seed is None else game_seed(seed, hidden_state, game))
+                for game in range(first_game, first_game + num_games)
+            ])
+
+
+def call_capturing_errors(func, args):
+    try:
+        return True, func(*args)
+    except Exception:
+        return False, traceback.format_exc()
+
+
+MAX_IN_FLIGHT = 200
+def imap_unordered_bounded(pool, func, tasks, max_in_flight=MAX_IN_FLIGHT):
+    """
+    Yields func(*args) for every args in tasks, in completion order. Unlike pool.imap_unordered, which
+    queues every task up front, at most max_in_flight tasks are submitted but not yet consumed.
+    """
+    pending = []
+    tasks = iter(tasks)
+    exhausted = False
+    while not exhausted or len(pending) > 0:
+        while not exhausted and len(pending) < max_in_flight:
+            try:
+                args = next(tasks)
+            except StopIteration:
+                exhausted = True
+                break
+            pending.append(pool.apply_async(call_capturing_errors, (func, args)))
+
+        if len(pending) > 0:
+            finished = [ result for result in pending if result.ready() ]
+            if len(finished) == 0:
+                # A short timeout keeps the wait interruptible with Ctrl-C
+                pending[0].wait(0.1)
                 continue
-            seen_bot_orders.add(bot_order_str)
+            pending = [ result for result in pending if result not in finished ]
+            for result in finished:
+                # get() raises if the task failed outside func too, e.g. when its result can't be pickled
+                ok, value = result.get()
+                if not ok:
+                    raise RuntimeError("Game failed in worker:\n{}".format(value))
+                yield value
 
-            for _ in range(games_per_matching):
-                async_result = pool.apply_async(large_tournament_parallel_helper, (bot_order, hidden_state, beliefs, start_state))
-                async_results.append(async_result)
-                
-    result = [ async_result.get() for async_result in async_results ]
 
+def results_to_dataframe(result, num_players):
     df = pd.DataFrame(result, columns=sorted(result[0].keys()))
     df['winner'] = df['winner'].astype('category')
     df['win_type'] = df['win_type'].astype('category')
+    for player in range(num_players):
+        df['bot_{}'.format(player)] = df['bot_{}'.format(player)].astype('category')
+        df['bot_{}_role'.format(player)] = df['bot_{}_role'.format(player)].astype('category')
+    return df
+
+
+def write_dataframe(filename, dataframe):
+    """
+    Writes to a temporary file first, so a crash never leaves a truncated file behind
+    """
+    tmp_filename = filename + '.tmp'
+    with gzip.open(tmp_filename, 'w') as f:
+        dataframe.to_msgpack(f)
+    os.rename(tmp_filename, filename)
+
+
+def next_part_number(prefix):
+    parts = glob.glob('{}_*.msg.gz'.format(prefix))
+    if len(parts) == 0:
+        return 0
+    return 1 + max(int(part[len(prefix) + 1:-len('.msg.gz')]) for part in parts)
+
+
+class ChunkedResultWriter(object):
+    """
+    Buffers game stats and writes them every chunk_size games to <prefix>_<part>.msg.gz, so memory stays
+    bounded and every finished chunk is usable even if the run dies. Chunks only end on unit boundaries, and
+    with a ledger a unit is marked complete once the chunk holding its games is on disk. Games of a unit are
+    tagged with a game_key, so if the run dies between the two and the unit is played again on resume,
+    read_tournament_results drops the second copy.
+    """
+    def __init__(self, prefix, num_players, chunk_size=10000, ledger=None):
+        self.prefix = prefix
+        self.num_players = num_players
+        self.chunk_size = chunk_size
+        self.ledger = ledger
+        self.buffer = []
+        self.pending_units = []
+        self.num_parts = next_part_number(prefix)
+        self.num_games = 0
+
+
+    def append(self, game_stat):
+        self.append_unit(None, [game_stat])
+
+
+    def append_unit(self, unit, game_stats):
+        if unit is None:
+            game_keys = [None] * len(game_stats)
+        else:
+            matching, first_game, num_games = parse_unit_key(unit)
+            assert len(game_stats) == num_games, "Unit {} has {} games".format(unit, len(game_stats))
+            game_keys = [ '{}|{}'.format(matching, game) for game in range(first_game, first_game + num_games) ]
+        for game_stat, game_key in zip(game_stats, game_keys):
+            game_stat = dict(game_stat)
+            game_stat['game_key'] = game_key
+            self.buffer.append(game_stat)
+        self.num_games += len(game_stats)
+        if unit is not None:
+            self.pending_units.append(unit)
+        if len(self.buffer) >= self.chunk_size:
+            self.flush()
+
+
+    def flush(self):
+        if len(self.buffer) > 0:
+            filename = '{}_{:05d}.msg.gz'.format(self.prefix, self.num_parts)
+            print "Writing {}".format(filename)
+            write_dataframe(filename, results_to_dataframe(self.buffer, self.num_players))
+            self.buffer = []
+            self.num_parts += 1
+        if self.ledger is not None:
+            self.ledger.mark_complete(self.pending_units)
+        self.pending_units = []
+
+
+    def close(self):
+        self.flush()
+
+
+def read_tournament_results(pattern='tournaments/*.msg.gz'):
+    """
+    Loads and concatenates every result file (or chunk) matching pattern. A game written twice (see
+    ChunkedResultWriter) is only kept once.
+    """
+    result = []
+    for filename in sorted(glob.glob(pattern)):
+        with gzip.open(filename, 'r') as f:
+            result.append(pd.read_msgpack(f))
+    df = pd.concat(result)
+    if 'game_key' in df.columns:
+        df = df[df['game_key'].isnull() | ~df['game_key'].duplicated()]
+    df.reset_index(drop=True, inplace=True)
+    for column in df.columns:
+        if not column.endswith('_payoff'):
+            df[column] = df[column].astype('category')
+    return df
+
+
+def run_large_tournament_parallel(pool, bots_classes, roles, games_per_matching=50, recorder=None, writer=None, ledger=None, timer=None, seed=None):
+    """
+    Games stream back as they finish. With a writer (e.g. a ChunkedResultWriter) each game stat goes to it and
+    nothing is returned; otherwise the stats are returned as a DataFrame. Units of work already in the ledger
+    are skipped; the writer should share the ledger, so it can mark new units as their results are written.
+    """
+    print "Running {}".format(' '.join(map(lambda c: c.__name__, bots_classes)))
+
+    result = []
+    tasks = large_tournament_tasks(bots_classes, roles, games_per_matching, recorder is not None, ledger=ledger, timed=timer is not None, seed=seed)
+    for unit, batch, _ in imap_unordered_bounded(pool, large_tournament_batch_helper, tasks):
+        game_stats = [ game_stat for game_stat, _, _ in batch ]
+        if writer is not None:
+            writer.append_unit(unit, game_stats)
+        else:
+            result.extend(game_stats)
+        for _, trajectories, game_timer in batch:
+            if recorder is not None:
+                recorder.extend(trajectories)
+            if timer is not None:
+                timer.extend(game_timer)
+
+    if writer is not None or len(result) == 0:
+        return None
+    return results_to_dataframe(result, len(roles))
+
+
+def run_vectorized_tournament(bots_classes, roles, games_per_matching=50):
+    """
+    Same output as run_large_tournament, but plays every game of a bot order at once in a
+    VectorizedAvalonEnv. Only works for bots which have a batched policy.
+    """
+    print "Running vectorized {}".format(' '.join(map(lambda c: c.__name__, bots_classes)))
+
+    hidden_states = []
+    for hidden_state in multiset_permutations(roles):
+        hidden_states.extend([hidden_state] * games_per_matching)
+
+    columns = defaultdict(lambda: [])
+    for bot_order, bot_order_str in distinct_bot_orders(bots_classes):
+        env = VectorizedAvalonEnv(hidden_states)
+        values = env.run([ batched_policy_for(bot_cls) for bot_cls in bot_order ])
+        game_ends = env.game_end_tuples()
+        columns['winner'].extend(winner for winner, _ in game_ends)
+        columns['win_type'].extend(win_type for _, win_type in game_ends)
+        for player, bot_name in enumerate(bot_order_str):
+            columns['bot_{}'.format(player)].extend([bot_name] * len(hidden_states))
+            columns['bot_{}_role'.format(player)].extend(hidden_state[player] for hidden_state in hidden_states)
+            columns['bot_{}_payoff'.format(player)].extend(values[:, player])
+
+    df = pd.DataFrame(dict(columns), columns=sorted(columns.keys()))
+    df['winner'] = df['winner'].astype('category')
+    df['win_type'] = df['win_type'].astype('category')
     for player in range(len(roles)):
         df['bot_{}'.format(player)] = df['bot_{}'.format(player)].astype('category')
         df['bot_{}_role'.format(player)] = df['bot_{}_role'.format(player)].astype('category')
@@ -136,9 +500,10 @@ def run_large_tournament_parallel(pool, bots_classes, roles, games_per_matching=
 
 def run_game_and_create_bots(hidden_state, beliefs, config):
     start_state = AvalonState.start_state(len(hidden_state))
-    bots = [ bot['bot']() for bot in config ]
-    for player, (bot, config) in enumerate(zip(bots, config)):
-        bot.reset(start_state, player, config['role'], beliefs[player])
+    bots = [
+        reset_worker_bot(bot['bot'], start_state, player, bot['role'], beliefs[player])
+        for player, bot in enumerate(config)
+    ]
     return run_game(start_state, hidden_state, bots)
 
 
@@ -158,7 +523,7 @@ def run_simple_tournament(config, num_games=1000, granularity=100):
         starting_hidden_states(player, hidden_state, all_hidden_states) for player in range(len(config))
     ]
 
-    pool = multiprocessing.Pool(4)
+    pool = multiprocessing.Pool(4, initializer=share_cores, initargs=(4,))
     results = []
 
     for i in range(num_games):
@@ -228,29 +593,96 @@ def run_all_combos_simple(bots, roles, games_per_matching=50):
             dataframe.to_msgpack(f)
 
 
-def run_all_combos(bots, roles, games_per_matching=50, parallelization=16):
-    pool = multiprocessing.Pool(parallelization)
-    results = []
-    for combination in itertools.combinations_with_replacement(bots, r=len(roles)):
-        combo_name = '-'.join(map(lambda c: c.__name__, combination))
-        results.append(
-            (combo_name, run_large_tournament_parallel(pool, combination, roles, games_per_matching=games_per_matching))
-        )
-
-    pool.close()
-    pool.join()
-
-    job_id = os.urandom(10).encode('hex')
-
-    for combo_name, dataframe in results:
-        filename = 'tournaments/{}_{}.msg.gz'.format(combo_name, job_id)
-        print "Writing {}".format(filename)
-        with gzip.open(filename, 'w') as f:
-            dataframe.to_msgpack(f)
+def run_all_combos(bots, roles, games_per_matching=50, parallelization=16, record=False, chunk_size=10000, job_id=None, time_bots=False, seed=None):
+    """
+    Results stream to tournaments/<combo>_<job_id>_<part>.msg.gz in chunks of chunk_size games, and finished
+    units of work are logged in tournaments/<job_id>.ledger. Pass the job_id of a killed run to resume it.
+    If record is set, every game is also written to tournaments/<job_id>.traj (after a crash, this can
+    include games from units that get re-run). If time_bots is set, the latency of every bot call in a
+    combination goes to tournaments/<combo>_<job_id>.latency.gz (see battlefield.latency). With a seed, games
+    are seeded for paired comparisons between runs (see battlefield.seeding).
+    """
+    pool = multiprocessing.Pool(parallelization, initializer=share_cores, initargs=(parallelization,))
+    job_id = job_id or os.urandom(10).encode('hex')
+    ledger = JobLedger('tournaments/{}.ledger'.format(job_id))
+    print "Job {}: {} units already complete".format(job_id, len(ledger))
+    recorder = TrajectoryWriter('tournaments/{}.traj'.format(job_id)) if record else None
+    cost_model = BotCostModel()
+
+    writers = {}
+    timers = {}
+    def finish_combo(combo_name):
+        writers.pop(combo_name).close()
+        timer = timers.pop(combo_name, None)
+        if timer is not None and len(timer) > 0:
+            timer.write('tournaments/{}_{}.latency.gz'.format(combo_name, job_id))
+
+    # Every combination's units go through the pool as one stream, so no combination waits on the last
+    # games of the one before it
+    outstanding = Counter()
+    current_combo = [None]
+    def counted(tasks):
+        for task in tasks:
+            current_combo[0] = task[0]
+            outstanding[task[0]] += 1
+            yield task
+
+    finished = False
+    try:
+        tasks = all_combo_tasks(bots, roles, games_per_matching, record, cost_model, ledger=ledger, timed=time_bots, seed=seed)
+        for combo_name, unit, batch, seconds in imap_unordered_bounded(pool, combo_batch_helper, counted(tasks)):
+            if combo_name not in writers:
+                writers[combo_name] = ChunkedResultWriter('tournaments/{}_{}'.format(combo_name, job_id), len(roles), chunk_size=chunk_size, ledger=ledger)
+                timers[combo_name] = LatencyRecorder() if time_bots else None
+            writers[combo_name].append_unit(unit, [ game_stat for game_stat, _, _ in batch ])
+            for _, trajectories, game_timer in batch:
+                if recorder is not None:
+                    recorder.extend(trajectories)
+                if game_timer is not None:
+                    timers[combo_name].extend(game_timer)
+            cost_model.record(combo_name.split('-'), len(batch), seconds)
+
+            outstanding[combo_name] -= 1
+            if outstanding[combo_name] == 0 and combo_name != current_combo[0]:
+                finish_combo(combo_name)
+        finished = True
+    finally:
+        # Also on a failed game or Ctrl-C: the units already back get written and logged, so a resume skips them
+        for combo_name in writers.keys():
+            finish_combo(combo_name)
+        cost_model.save()
+        if finished:
+            pool.close()
+        else:
+            pool.terminate()
+        pool.join()
+        ledger.close()
+        if recorder is not None:
+            recorder.close()
+
+
+def all_combo_tasks(bots, roles, games_per_matching, record, cost_model, ledger=None, timed=False, seed=None):
+    """
+    Yields (combo_name, unit, args_list) for every unit of work of every combination of bots. The
+    combinations expected to take longest go first, and units are sized by cost_model so each takes about
+    the same time.
+    """
+    def expected_seconds(combination):
+        bot_names = [ bot_cls.__name__ for bot_cls in combination ]
+        num_bot_orders = math.factorial(len(bot_names)) / orbit_size(bot_names)
+        return cost_model.game_cost(bot_names) * num_bot_orders
+
+    combinations = sorted(itertools.combinations_with_replacement(bots, r=len(roles)), key=expected_seconds, reverse=True)
+    for combination in combinations:
+        bot_names = [ bot_cls.__name__ for bot_cls in combination ]
+        combo_name = '-'.join(bot_names)
+        unit_size = cost_model.unit_games(bot_names)
+        for unit, args_list in large_tournament_tasks(combination, roles, games_per_matching, record, ledger=ledger, timed=timed, seed=seed, games_per_unit=unit_size):
+            yield combo_name, unit, args_list
 
 
 def run_all_combos_parallel(bots, roles):
-    pool = multiprocessing.Pool()
+    pool = multiprocessing.Pool(initializer=share_cores, initargs=(multiprocessing.cpu_count(),))
     results = []
 
     for combination in itertools.combinations_with_replacement(bots, r=len(roles)):
@@ -325,7 +757,7 @@ def run_learning_tournament(bot_classes, winrate_track=None, winrate_window=1000
             print "Winrate: {}%".format(100 * float(sum(wins)) / len(wins))
 
 
-def run_single_threaded_tournament(config, num_games=1000, granularity=100):
+def run_single_threaded_tournament(config, num_games=1000, granularity=100, recorder=None, timer=None):
     tournament_statistics = {
         'bots': [
             { 'bot': bot['bot'].__name__, 'role': bot['role'], 'wins': 0, 'total': 0, 'win_percent': 0, 'payoff': 0.0 }
@@ -353,7 +785,7 @@ def run_single_threaded_tournament(config, num_games=1000, granularity=100):
         for player, (bot, c) in enumerate(zip(bots, config)):
             bot.reset(start_state, player, c['role'], beliefs[player])
 
-        payoffs, end_type = run_game(start_state, hidden_state, bots)
+        payoffs, end_type = run_game(start_state, hidden_state, bots, recorder=recorder, timer=timer)
         tournament_statistics['end_types'][end_type] = 1 + tournament_statistics['end_types'].get(end_type, 0)
 
         for b, payoff in zip(tournament_statistics['bots'], payoffs):
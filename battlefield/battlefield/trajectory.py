@@ -0,0 +1,177 @@
+import os
+import numpy as np
+
+from battlefield.avalon_types import ROLES, ROLE_CODES, EVIL_ROLES, proposal_to_mask
+from battlefield.vectorized import GAME_ENDS, GOOD_ASSASSIN_FAILED
+
+MAGIC = 'AVTRAJ\x00\x01'
+MAX_BOT_NAMES = 256
+BOT_NAME_DTYPE = np.dtype('S48')
+HEADER_SIZE = len(MAGIC) + MAX_BOT_NAMES * BOT_NAME_DTYPE.itemsize
+
+MAX_PLAYERS = 10
+MAX_PROPOSALS = 25
+MAX_MISSIONS = 5
+
+# Player sets (proposals, votes) are bitmasks with bit p set for player p
+TRAJECTORY_DTYPE = np.dtype([
+    ('seed', '<u4'),
+    ('num_players', 'u1'),
+    ('bots', '<u2', (MAX_PLAYERS,)),
+    ('roles', 'u1', (MAX_PLAYERS,)),
+    ('num_proposals', 'u1'),
+    ('proposers', 'u1', (MAX_PROPOSALS,)),
+    ('proposals', '<u2', (MAX_PROPOSALS,)),
+    ('votes', '<u2', (MAX_PROPOSALS,)),
+    ('num_missions', 'u1'),
+    ('mission_proposals', '<u2', (MAX_MISSIONS,)),
+    ('mission_fails', 'u1', (MAX_MISSIONS,)),
+    ('assassin_pick', 'i1'),
+    ('game_end', 'u1'),
+])
+
+
+class Trajectory(object):
+    """
+    Everything public that happened in one game, as a single TRAJECTORY_DTYPE record.
+    """
+    def __init__(self, hidden_state, bot_names, seed=0):
+        self.hidden_state = hidden_state
+        self.bot_names = bot_names
+        self.record = np.zeros((), dtype=TRAJECTORY_DTYPE)
+        self.record['seed'] = seed
+        self.record['num_players'] = len(hidden_state)
+        self.record['roles'][:len(hidden_state)] = [ROLE_CODES[role] for role in hidden_state]
+        self.record['assassin_pick'] = -1
+
+
+    def add(self, state, moves, observation):
+        """
+        Records the transition out of state
+        """
+        record = self.record
+        if state.status == 'propose':
+            n = record['num_proposals']
+            record['proposers'][n] = state.proposer
+            record['proposals'][n] = proposal_to_mask(observation)
+        elif state.status == 'vote':
+            n = record['num_proposals']
+            record['votes'][n] = sum(1 << p for p, vote in enumerate(observation) if vote.up)
+            record['num_proposals'] = n + 1
+        elif state.status == 'run':
+            n = record['num_missions']
+            record['mission_proposals'][n] = proposal_to_mask(state.proposal)
+            record['mission_fails'][n] = observation
+            record['num_missions'] = n + 1
+        elif state.status == 'merlin':
+            record['assassin_pick'] = moves[self.hidden_state.index('assassin')].merlin
+
+
+    def finish(self, game_end):
+        self.record['game_end'] = GAME_ENDS.index(game_end)
+
+
+class TrajectoryWriter(object):
+    """
+    Appends trajectories to a file: a magic string, a fixed-size table of bot names, then packed records.
+    Bot names are stored once in the table, and records refer to them by index.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        if os.path.exists(filename):
+            self.f = open(filename, 'r+b')
+            self.bot_names = read_header(self.f)
+            self.f.seek(0, os.SEEK_END)
+        else:
+            self.f = open(filename, 'w+b')
+            self.f.write(MAGIC)
+            self.f.write(np.zeros(MAX_BOT_NAMES, dtype=BOT_NAME_DTYPE).tobytes())
+            self.bot_names = []
+        self.bot_ids = { name: i for i, name in enumerate(self.bot_names) }
+
+
+    def bot_id(self, name):
+        if name not in self.bot_ids:
+            assert len(self.bot_names) < MAX_BOT_NAMES, "Too many distinct bots in one trajectory file"
+            assert len(name) <= BOT_NAME_DTYPE.itemsize, "Bot name too long: {}".format(name)
+            self.bot_ids[name] = len(self.bot_names)
+            self.f.seek(len(MAGIC) + len(self.bot_names) * BOT_NAME_DTYPE.itemsize)
+            self.f.write(np.array(name, dtype=BOT_NAME_DTYPE).tobytes())
+            self.f.seek(0, os.SEEK_END)
+            self.bot_names.append(name)
+        return self.bot_ids[name]
+
+
+    def append(self, trajectory):
+        record = trajectory.record
+        record['bots'][:len(trajectory.bot_names)] = [self.bot_id(name) for name in trajectory.bot_names]
+        self.f.write(record.tobytes())
+
+
+    def extend(self, trajectories):
+        for trajectory in trajectories:
+            self.append(trajectory)
+
+
+    def close(self):
+        self.f.close()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def read_header(f):
+    f.seek(0)
+    assert f.read(len(MAGIC)) == MAGIC, "Not a trajectory file"
+    names = np.frombuffer(f.read(MAX_BOT_NAMES * BOT_NAME_DTYPE.itemsize), dtype=BOT_NAME_DTYPE)
+    return [ name for name in names if name != '' ]
+
+
+def read_trajectories(filename):
+    """
+    Returns (records, bot_names). records is a read-only memory map of TRAJECTORY_DTYPE, so nothing is
+    loaded until it is used.
+    """
+    with open(filename, 'rb') as f:
+        bot_names = read_header(f)
+    num_records = (os.path.getsize(filename) - HEADER_SIZE) // TRAJECTORY_DTYPE.itemsize
+    if num_records == 0:
+        return np.zeros(0, dtype=TRAJECTORY_DTYPE), bot_names
+    records = np.memmap(filename, dtype=TRAJECTORY_DTYPE, mode='r', offset=HEADER_SIZE, shape=(num_records,))
+    return records, bot_names
+
+
+def good_won(records):
+    return records['game_end'] == GOOD_ASSASSIN_FAILED
+
+
+def evil_seats(records):
+    """
+    (num_records, MAX_PLAYERS) boolean array of which seats were evil
+    """
+    return np.isin(records['roles'], [ROLE_CODES[role] for role in EVIL_ROLES]) & seat_mask(records)
+
+
+def seat_mask(records):
+    return np.arange(MAX_PLAYERS) < records['num_players'][:, np.newaxis]
+
+
+def terminal_values(records):
+    """
+    The payoff of each seat in each game, matching AvalonState.terminal_value. Empty seats get 0.
+    """
+    num_players = records['num_players'].astype(np.float64)
+    num_evil = np.sum(evil_seats(records), axis=1)
+    num_good = num_players - num_evil
+    good_amount = np.where(good_won(records), 1.0, -1.0)[:, np.newaxis]
+    evil_amount = -good_amount * (num_good / num_evil)[:, np.newaxis]
+    return np.where(evil_seats(records), evil_amount, good_amount) * seat_mask(records)
+
+
+def role_names(records):
+    return np.array(ROLES)[records['roles']]
@@ -0,0 +1,327 @@
+import itertools
+import numpy as np
+
+from battlefield.avalon_types import AVALON_PROPOSE_SIZES, AVALON_PLAYER_COUNT, EVIL_ROLES, GOOD_ROLES
+
+PROPOSE, VOTE, RUN, MERLIN, END = range(5)
+STATUS_NAMES = ['propose', 'vote', 'run', 'merlin', 'end']
+
+GOOD_ASSASSIN_FAILED, EVIL_ASSASSIN_PICKED, EVIL_TOO_MANY_FAILS, EVIL_NO_RESOLUTION = range(4)
+GAME_ENDS = [
+    ('good', 'assassin failed'),
+    ('evil', 'assassin picked'),
+    ('evil', 'Too many bad fails'),
+    ('evil', 'Too many proposals and no resolution'),
+]
+
+PROPOSAL_MASKS = {}
+def proposal_masks(num_players, size, containing=None):
+    """
+    Returns the bitmask of every proposal of this size, in the same order as AvalonState.legal_actions.
+    If containing is given, only the proposals with that player on them.
+    """
+    key = (num_players, size, containing)
+    if key not in PROPOSAL_MASKS:
+        masks = np.array([
+            sum(1 << p for p in proposal)
+            for proposal in itertools.combinations(range(num_players), r=size)
+        ], dtype=np.int32)
+        if containing is not None:
+            masks = masks[(masks >> containing) & 1 == 1]
+        PROPOSAL_MASKS[key] = masks
+    return PROPOSAL_MASKS[key]
+
+
+def mask_to_proposal(mask):
+    return tuple(p for p in range(10) if mask & (1 << p))
+
+
+class VectorizedAvalonEnv(object):
+    """
+    Runs many games of the same size in lockstep, with the whole game state held as parallel arrays.
+    Every call to step() advances each unfinished game by exactly one transition.
+    """
+    def __init__(self, hidden_states):
+        self.hidden_states = [tuple(hidden_state) for hidden_state in hidden_states]
+        self.num_games = len(self.hidden_states)
+        self.num_players = len(self.hidden_states[0])
+        assert all(len(h) == self.num_players for h in self.hidden_states), "All games must have the same size"
+
+        self.num_good, self.num_evil = AVALON_PLAYER_COUNT[self.num_players]
+        sizes = AVALON_PROPOSE_SIZES[self.num_players]
+        self.mission_sizes = np.array([size for size, _ in sizes])
+        self.mission_fails_required = np.array([fails for _, fails in sizes])
+
+        self.is_evil = np.array([[role in EVIL_ROLES for role in h] for h in self.hidden_states])
+        self.evil_mask = np.sum(self.is_evil.astype(np.int32) << np.arange(self.num_players), axis=1).astype(np.int32)
+        # What the assassin can see: every evil player except oberon
+        self.visible_evil = np.array([[role in EVIL_ROLES and role != 'oberon' for role in h] for h in self.hidden_states])
+        self.merlin = np.array([h.index('merlin') for h in self.hidden_states])
+        self.assassin = np.array([h.index('assassin') for h in self.hidden_states])
+        self.reset()
+
+
+    def reset(self):
+        n = self.num_games
+        self.proposer = np.zeros(n, dtype=np.int8)
+        self.propose_count = np.zeros(n, dtype=np.int8)
+        self.succeeds = np.zeros(n, dtype=np.int8)
+        self.fails = np.zeros(n, dtype=np.int8)
+        self.status = np.full(n, PROPOSE, dtype=np.int8)
+        self.proposal = np.zeros(n, dtype=np.int32)
+        self.game_end = np.full(n, -1, dtype=np.int8)
+
+
+    def round(self, games):
+        return self.succeeds[games] + self.fails[games]
+
+
+    def games_with_status(self, status):
+        return np.flatnonzero(self.status == status)
+
+
+    def is_done(self):
+        return np.all(self.status == END)
+
+
+    def random_proposals(self, games, rng=np.random, containing=None):
+        """
+        Picks a uniformly random proposal of the right size for every game in games
+        """
+        result = np.zeros(len(games), dtype=np.int32)
+        sizes = self.mission_sizes[self.round(games)]
+        for size in np.unique(sizes):
+            which = np.flatnonzero(sizes == size)
+            masks = proposal_masks(self.num_players, size, containing=containing)
+            result[which] = masks[rng.randint(len(masks), size=len(which))]
+        return result
+
+
+    def apply_proposals(self, games, masks):
+        self.proposal[games] = masks
+        self.status[games] = VOTE
+
+
+    def apply_votes(self, games, up_votes):
+        """
+        up_votes is a (len(games), num_players) boolean array
+        """
+        passed = 2 * np.sum(up_votes, axis=1) > self.num_players
+        passed_games = games[passed]
+        self.status[passed_games] = RUN
+
+        failed_games = games[~passed]
+        new_count = self.propose_count[failed_games] + 1
+        no_resolution = failed_games[new_count >= 5]
+        self._end_games(no_resolution, EVIL_NO_RESOLUTION)
+
+        continuing = failed_games[new_count < 5]
+        self.proposer[continuing] = (self.proposer[continuing] + 1) % self.num_players
+        self.propose_count[continuing] += 1
+        self.proposal[continuing] = 0
+        self.status[continuing] = PROPOSE
+
+
+    def apply_missions(self, games, num_fails):
+        failed = num_fails >= self.mission_fails_required[self.round(games)]
+
+        failed_games = games[failed]
+        self.fails[failed_games] += 1
+        self._end_games(failed_games[self.fails[failed_games] == 3], EVIL_TOO_MANY_FAILS)
+        self._next_round(failed_games[self.fails[failed_games] < 3])
+
+        succeeded_games = games[~failed]
+        self.succeeds[succeeded_games] += 1
+        merlin_games = succeeded_games[self.succeeds[succeeded_games] == 3]
+        self.proposer[merlin_games] = 0
+        self.propose_count[merlin_games] = 0
+        self.proposal[merlin_games] = 0
+        self.status[merlin_games] = MERLIN
+        self._next_round(succeeded_games[self.succeeds[succeeded_games] < 3])
+
+
+    def apply_assassin_picks(self, games, picks):
+        correct = picks == self.merlin[games]
+        self._end_games(games[correct], EVIL_ASSASSIN_PICKED)
+        self._end_games(games[~correct], GOOD_ASSASSIN_FAILED)
+
+
+    def _next_round(self, games):
+        self.proposer[games] = (self.proposer[games] + 1) % self.num_players
+        self.propose_count[games] = 0
+        self.proposal[games] = 0
+        self.status[games] = PROPOSE
+
+
+    def _end_games(self, games, game_end):
+        self.proposer[games] = 0
+        self.propose_count[games] = 0
+        self.proposal[games] = 0
+        self.status[games] = END
+        self.game_end[games] = game_end
+
+
+    def step(self, policies):
+        """
+        Asks the batched policies (one per seat) for moves and applies them
+        """
+        propose_games = self.games_with_status(PROPOSE)
+        vote_games = self.games_with_status(VOTE)
+        run_games = self.games_with_status(RUN)
+        merlin_games = self.games_with_status(MERLIN)
+
+        if len(propose_games) > 0:
+            masks = np.zeros(len(propose_games), dtype=np.int32)
+            for player, policy in enumerate(policies):
+                which = np.flatnonzero(self.proposer[propose_games] == player)
+                if len(which) > 0:
+                    masks[which] = policy.propose(self, propose_games[which], player)
+            self.apply_proposals(propose_games, masks)
+
+        if len(vote_games) > 0:
+            up_votes = np.zeros((len(vote_games), self.num_players), dtype=bool)
+            for player, policy in enumerate(policies):
+                up_votes[:, player] = policy.vote(self, vote_games, player)
+            self.apply_votes(vote_games, up_votes)
+
+        if len(run_games) > 0:
+            num_fails = np.zeros(len(run_games), dtype=np.int8)
+            for player, policy in enumerate(policies):
+                on_mission = (self.proposal[run_games] >> player) & 1 == 1
+                # Good players only have one legal mission action
+                which = np.flatnonzero(on_mission & self.is_evil[run_games, player])
+                if len(which) > 0:
+                    num_fails[which] += policy.mission(self, run_games[which], player).astype(np.int8)
+            self.apply_missions(run_games, num_fails)
+
+        if len(merlin_games) > 0:
+            picks = np.zeros(len(merlin_games), dtype=np.int8)
+            for player, policy in enumerate(policies):
+                which = np.flatnonzero(self.assassin[merlin_games] == player)
+                if len(which) > 0:
+                    picks[which] = policy.pick_merlin(self, merlin_games[which], player)
+            self.apply_assassin_picks(merlin_games, picks)
+
+
+    def run(self, policies):
+        """
+        Plays every game to the end. Returns the (num_games, num_players) payoff matrix.
+        """
+        for player, policy in enumerate(policies):
+            policy.reset(self, player)
+        while not self.is_done():
+            self.step(policies)
+        return self.terminal_values()
+
+
+    def terminal_values(self):
+        """
+        Returns the payoff for each player in each game, matching AvalonState.terminal_value
+        """
+        assert self.is_done(), "Not all games have ended"
+        good_won = (self.game_end == GOOD_ASSASSIN_FAILED)[:, np.newaxis]
+        good_amount = np.where(good_won, 1.0, -1.0)
+        evil_amount = -good_amount * float(self.num_good) / self.num_evil
+        return np.where(self.is_evil, evil_amount, good_amount)
+
+
+    def game_end_tuples(self):
+        return [GAME_ENDS[game_end] for game_end in self.game_end]
+
+
+
+class BatchedPolicy(object):
+    """
+    A policy which decides for many games at once. Every method gets the env, the indices of the games
+    to decide for, and the seat the policy is playing, and returns one decision per game.
+    """
+    def __init__(self, rng=np.random):
+        self.rng = rng
+
+
+    def reset(self, env, player):
+        pass
+
+
+    def propose(self, env, games, player):
+        raise NotImplemented
+
+
+    def vote(self, env, games, player):
+        raise NotImplemented
+
+
+    def mission(self, env, games, player):
+        raise NotImplemented
+
+
+    def pick_merlin(self, env, games, player):
+        raise NotImplemented
+
+
+class BatchedRandomBot(BatchedPolicy):
+    def propose(self, env, games, player):
+        return env.random_proposals(games, rng=self.rng)
+
+
+    def vote(self, env, games, player):
+        return self.rng.random_sample(len(games)) < 0.5
+
+
+    def mission(self, env, games, player):
+        return self.rng.random_sample(len(games)) < 0.5
+
+
+    def pick_merlin(self, env, games, player):
+        return self.rng.randint(env.num_players, size=len(games))
+
+
+class BatchedRandomBotUV(BatchedRandomBot):
+    def vote(self, env, games, player):
+        return np.ones(len(games), dtype=bool)
+
+
+class BatchedSimpleBot(BatchedRandomBot):
+    def vote(self, env, games, player):
+        return np.ones(len(games), dtype=bool)
+
+
+    def mission(self, env, games, player):
+        return np.ones(len(games), dtype=bool)
+
+
+class BatchedSimpleStatsBot(BatchedPolicy):
+    def propose(self, env, games, player):
+        return env.random_proposals(games, rng=self.rng, containing=player)
+
+
+    def vote(self, env, games, player):
+        on_proposal = (env.proposal[games] >> player) & 1 == 1
+        last_chance = (env.propose_count[games] == 4) & ~env.is_evil[games, player]
+        up_prob = np.where(on_proposal | last_chance, 6.0 / 7.0, 1.0 / 7.0)
+        return self.rng.random_sample(len(games)) < up_prob
+
+
+    def mission(self, env, games, player):
+        fail_prob = np.where(env.round(games) == 0, 1.0 / 7.0, 6.0 / 7.0)
+        return self.rng.random_sample(len(games)) < fail_prob
+
+
+    def pick_merlin(self, env, games, player):
+        # Merlin is equally likely to be any player the assassin can't see is evil
+        candidates = ~env.visible_evil[games]
+        weights = self.rng.random_sample(candidates.shape) * candidates
+        return np.argmax(weights, axis=1)
+
+
+BATCHED_POLICIES = {
+    'RandomBot': BatchedRandomBot,
+    'RandomBotUV': BatchedRandomBotUV,
+    'SimpleBot': BatchedSimpleBot,
+    'SimpleStatsBot': BatchedSimpleStatsBot,
+}
+
+
+def batched_policy_for(bot_cls):
+    assert bot_cls.__name__ in BATCHED_POLICIES, "{} has no batched policy".format(bot_cls.__name__)
+    return BATCHED_POLICIES[bot_cls.__name__]()
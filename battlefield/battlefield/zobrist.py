@@ -0,0 +1,88 @@
+import hashlib
+
+from battlefield.avalon_types import proposal_to_mask
+
+# Hashes are 128 bit: the low 64 bits pick the slot in a TranspositionTable, the high 64 bits check for collisions
+MASK_64 = (1 << 64) - 1
+
+def random_key(*args):
+    """
+    A fixed pseudo-random 128 bit number for args, the same in every process
+    """
+    return int(hashlib.md5(repr(args)).hexdigest(), 16)
+
+
+STATE_HASHES = {}
+def state_hash(state_key):
+    if state_key not in STATE_HASHES:
+        STATE_HASHES[state_key] = random_key('state', state_key)
+    return STATE_HASHES[state_key]
+
+
+def observation_code(state, observation):
+    if state.status == 'propose':
+        return proposal_to_mask(observation)
+    if state.status == 'vote':
+        return sum(1 << p for p, vote in enumerate(observation) if getattr(vote, 'up', vote))
+    if state.status == 'run':
+        return (proposal_to_mask(state.proposal) << 4) | observation
+    return int(observation)
+
+
+OBSERVATION_HASHES = {}
+def observation_hash(state, observation):
+    """
+    The Zobrist key for making observation from state. Every (round, propose count, status) shows up at most
+    once in a game, so it serves as the position of the observation in the public history.
+    """
+    key = (state.succeeds + state.fails, state.propose_count, state.status, observation_code(state, observation))
+    if key not in OBSERVATION_HASHES:
+        OBSERVATION_HASHES[key] = random_key('observation', key)
+    return OBSERVATION_HASHES[key]
+
+
+def extend_history_hash(history_hash, state, observation):
+    """
+    The hash of a public history after observation was made from state. Start from 0 for an empty history.
+    """
+    return history_hash ^ observation_hash(state, observation)
+
+
+class TranspositionTable(object):
+    """
+    A bounded map from 128 bit hashes to values. Entries live in a slot picked by the low 64 bits and
+    remember the high 64 bits, so a lookup which lands on another position's entry is a miss, not a wrong value.
+    Like the other caches here, it is wiped when full.
+    """
+    def __init__(self, max_entries=1000000):
+        self.max_entries = max_entries
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self.collisions = 0
+
+
+    def get(self, key, default=None):
+        entry = self.entries.get(key & MASK_64)
+        if entry is None:
+            self.misses += 1
+            return default
+        if entry[0] != key >> 64:
+            self.collisions += 1
+            return default
+        self.hits += 1
+        return entry[1]
+
+
+    def put(self, key, value):
+        if len(self.entries) >= self.max_entries:
+            self.entries = {}
+        self.entries[key & MASK_64] = (key >> 64, value)
+
+
+    def __len__(self):
+        return len(self.entries)
+
+
+    def stats(self):
+        return { 'entries': len(self.entries), 'hits': self.hits, 'misses': self.misses, 'collisions': self.collisions }
@@ -35,6 +35,7 @@ from battlefield.tournament import (
     run_single_threaded_tournament,
     run_and_print_game
 )
+from battlefield.distributed import run_coordinator
 from battlefield.compare_to_human import compute_human_statistics, print_human_statistics
 from battlefield.predict_roles import predict_evil_over_human_data, predict_evil_using_voting, grid_search
 from battlefield.determine_reachable_states import determine_reachable
@@ -196,6 +197,17 @@ def benchmark_performance():
     run_all_combos(bot_classes, roles, games_per_matching=games_per_matching, parallelization=40)
 
 
+def benchmark_performance_distributed():
+    # Listens on localhost. For workers on other hosts, pass address=('0.0.0.0', 50123) and start them with
+    # AVALON_AUTHKEY=<the printed key> python -m battlefield.distributed <this host>:50123
+    print "Launching coordinator..."
+    games_per_matching = int(sys.argv[1])
+    bot_names = sys.argv[2:]
+    bot_classes = [ STRING_TO_BOT[name] for name in bot_names ]
+    roles = ['merlin', 'servant', 'assassin', 'minion', 'servant']
+    run_coordinator(bot_classes, roles, games_per_matching=games_per_matching)
+
+
 
 
 if __name__ == "__main__":
@@ -211,6 +223,7 @@ if __name__ == "__main__":
     #     run_single_threaded_tournament(TOURNAMENT_CONFIG, num_games=100, granularity=1)
     # )
     benchmark_performance()
+    # benchmark_performance_distributed()
     # predict_merlin()
     # human_compare()
     # determine_reachable(RandomBot, set(['merlin', 'minion', 'assassin', 'servant']), 5)
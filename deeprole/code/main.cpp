@@ -2,7 +2,9 @@
 #include <vector>
 #include <string>
 #include <fstream>
+#include <sstream>
 #include <iomanip>
+#include <cstdint>
 #include "json.h"
 #include "optionparser.h"
 #include "lookahead.h"
@@ -30,6 +32,8 @@ enum optionIndex {
     PLAY_MODE,
     PROPOSER,
     NN_TEST,
+    SERVE_MODE,
+    BINARY_OUTPUT,
 };
 
 const option::Descriptor usage[] = {
@@ -49,6 +53,8 @@ const option::Descriptor usage[] = {
     { PLAY_MODE,       0,   "l",           "play",    option::Arg::Optional,       "  \t-l, --play  \tRun in play mode. Read a belief from stdin, output data to stdout." },
     { PROPOSER,        0,   "r",       "proposer",    option::Arg::Optional,       "  \t-r, --proposer=<num>  \tUse a specific proposer for play mode." },
     { NN_TEST,         0,   "u",        "nn-test",    option::Arg::Optional,       "  \t-u, --nn-test  \tRun neural net test" },
+    { SERVE_MODE,      0,   "e",          "serve",    option::Arg::Optional,       "  \t-e, --serve  \tRun as a long-lived solver. Read length-prefixed JSON requests from stdin, write length-prefixed results to stdout." },
+    { BINARY_OUTPUT,   0,   "b",         "binary",    option::Arg::Optional,       "  \t-b, --binary  \tWrite the play mode lookahead in the binary format (see serialization.cpp) instead of JSON." },
     { 0, 0, 0, 0, 0, 0 }
 };
 
@@ -174,7 +180,8 @@ void play_mode(
     const int proposer,
     const int iterations,
     const int wait_iterations,
-    const std::string model_search_dir
+    const std::string model_search_dir,
+    const bool binary_output
 ) {
     cerr << "~.~.~.~.~.~.~.~. DEEPROLE PLAY MODE .~.~.~.~.~.~.~.~" << endl;
     cerr << "           # Iterations: " << iterations << endl;
@@ -205,7 +212,83 @@ void play_mode(
     ViewpointVector _dummy_values[NUM_PLAYERS];
     cfr_get_values(lookahead.get(), iterations, wait_iterations, starting_probs, true, _dummy_values);
     calculate_cumulative_strategy(lookahead.get());
-    json_serialize_lookahead(lookahead.get(), starting_probs, std::cout);
+    if (binary_output) {
+        binary_serialize_lookahead(lookahead.get(), starting_probs, std::cout);
+    } else {
+        json_serialize_lookahead(lookahead.get(), starting_probs, std::cout);
+    }
+}
+
+// Frames are a 4 byte little-endian length followed by that many bytes of payload
+bool read_frame(std::istream& in_stream, std::string* payload) {
+    unsigned char header[4];
+    if (!in_stream.read(reinterpret_cast<char*>(header), 4)) {
+        return false;
+    }
+    uint32_t length = (
+        ((uint32_t) header[0]) |
+        ((uint32_t) header[1] << 8) |
+        ((uint32_t) header[2] << 16) |
+        ((uint32_t) header[3] << 24)
+    );
+    payload->resize(length);
+    return length == 0 || (bool) in_stream.read(&(*payload)[0], length);
+}
+
+void write_frame(std::ostream& out_stream, const std::string& payload) {
+    uint32_t length = payload.size();
+    unsigned char header[4] = {
+        (unsigned char) (length & 0xff),
+        (unsigned char) ((length >> 8) & 0xff),
+        (unsigned char) ((length >> 16) & 0xff),
+        (unsigned char) ((length >> 24) & 0xff)
+    };
+    out_stream.write(reinterpret_cast<char*>(header), 4);
+    out_stream.write(payload.data(), length);
+    out_stream.flush();
+}
+
+void serve_mode(const int depth, const std::string model_search_dir) {
+    cerr << "~.~.~.~.~.~.~.~. DEEPROLE SERVE MODE .~.~.~.~.~.~.~.~" << endl;
+    cerr << "                  Depth: " << depth << endl;
+    cerr << "       Model search dir: " << model_search_dir << endl;
+
+    // Models stay loaded (see load_model) between requests, so only the first solve of each round pays for them
+    std::string request_payload;
+    while (read_frame(std::cin, &request_payload)) {
+        nlohmann::json request = nlohmann::json::parse(request_payload);
+        const int proposer = request["proposer"];
+        const int num_succeeds = request["succeeds"];
+        const int num_fails = request["fails"];
+        const int propose_count = request["propose_count"];
+        const int iterations = request["iterations"];
+        const int wait_iterations = request["wait_iterations"];
+
+        auto lookahead = create_avalon_lookahead(
+            num_succeeds,
+            num_fails,
+            proposer,
+            propose_count,
+            depth,
+            model_search_dir
+        );
+
+        AssignmentProbs starting_probs;
+        std::istringstream belief_stream(request["belief"].dump());
+        json_deserialize_starting_reach_probs(belief_stream, &starting_probs);
+
+        ViewpointVector _dummy_values[NUM_PLAYERS];
+        cfr_get_values(lookahead.get(), iterations, wait_iterations, starting_probs, true, _dummy_values);
+        calculate_cumulative_strategy(lookahead.get());
+
+        std::ostringstream response;
+        if (request.value("binary", false)) {
+            binary_serialize_lookahead(lookahead.get(), starting_probs, response);
+        } else {
+            json_serialize_lookahead(lookahead.get(), starting_probs, response);
+        }
+        write_frame(std::cout, response.str());
+    }
 }
 
 void nn_test_mode(
@@ -279,6 +362,11 @@ int main(int argc, char* argv[]) {
     int depth = (s_depth.empty()) ? 1 : std::stoi(s_depth);
     int proposer = (s_proposer.empty()) ? -1 : std::stoi(s_proposer);
 
+    if (options[SERVE_MODE]) {
+        serve_mode(depth, model_search_dir);
+        return 0;
+    }
+
     if (options[TEST_MODE]) {
         if (proposer < 0 || proposer >= NUM_PLAYERS) {
             proposer = 0;
@@ -311,8 +399,9 @@ int main(int argc, char* argv[]) {
                 proposer,
                 num_iterations,
                 num_wait_iters,
-                model_search_dir
-            );            
+                model_search_dir,
+                options[BINARY_OUTPUT]
+            );
         } else {
             nn_test_mode(num_succeeds, num_fails, propose_count, proposer, model_search_dir);
         }
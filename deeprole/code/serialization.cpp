@@ -164,3 +164,120 @@ void json_serialize_lookahead(const LookaheadNode* root, const AssignmentProbs&
     json_serialize_node(root, starting_reach_probs, result);
     out_stream << std::setprecision(17) << std::setw(2) << result << std::endl;
 }
+
+// Binary layout (all little-endian):
+//   header:     char[4] "DRLB", int32 version, int32 num_nodes, int32 num_doubles
+//   options:    int32[2][NUM_PROPOSAL_OPTIONS], the proposal bitstrings of 2 and 3 person rounds
+//   nodes:      int32[num_nodes][BINARY_NODE_FIELDS], in breadth first order so each node's children are contiguous
+//   doubles:    float64[num_doubles], each node's strategies (or beliefs) starting at its data_offset
+// Node fields are type, succeeds, fails, proposer, propose_count, proposal, propose_size (propose nodes only),
+// first_child, num_children and data_offset. data_offset is -1 for a node without data (or an impossible NN node).
+static const int BINARY_VERSION = 1;
+static const int BINARY_NODE_FIELDS = 10;
+
+template <typename Derived>
+static void append_row_major(const Eigen::ArrayBase<Derived>& array, std::vector<double>* doubles) {
+    for (int i = 0; i < array.rows(); i++) {
+        for (int j = 0; j < array.cols(); j++) {
+            doubles->push_back(array(i, j));
+        }
+    }
+}
+
+static int append_node_data(const LookaheadNode* node, const AssignmentProbs& starting_reach_probs, std::vector<double>* doubles) {
+    const int data_offset = doubles->size();
+    switch (node->type) {
+    case PROPOSE: {
+        append_row_major(*(node->propose_strategy), doubles);
+    } break;
+    case VOTE: {
+        for (int i = 0; i < NUM_PLAYERS; i++) {
+            append_row_major(node->vote_strategy->at(i), doubles);
+        }
+    } break;
+    case MISSION: {
+        // Players off the mission get zeros, the reader treats them as missing
+        for (int i = 0; i < NUM_PLAYERS; i++) {
+            if (((1 << i) & node->proposal) == 0) {
+                doubles->insert(doubles->end(), NUM_VIEWPOINTS * 2, 0.0);
+            } else {
+                append_row_major(node->mission_strategy->at(i), doubles);
+            }
+        }
+    } break;
+    case TERMINAL_MERLIN: {
+        for (int i = 0; i < NUM_PLAYERS; i++) {
+            append_row_major(node->merlin_strategy->at(i), doubles);
+        }
+    } break;
+    case TERMINAL_PROPOSE_NN: {
+        AssignmentProbs new_belief = *(node->full_reach_probs) * starting_reach_probs;
+        AssignmentProbs nozero_belief = starting_reach_probs;
+        calc_nozero_belief(node, starting_reach_probs, &nozero_belief);
+
+        double sum = new_belief.sum();
+        if (sum == 0.0) {
+            return -1;
+        }
+        new_belief /= sum;
+        nozero_belief /= nozero_belief.sum();
+        ViewpointVector nn_output[NUM_PLAYERS];
+        node->nn_model->predict(node->proposer, new_belief, nn_output);
+
+        append_row_major(new_belief, doubles);
+        append_row_major(nozero_belief, doubles);
+        for (int i = 0; i < NUM_PLAYERS; i++) {
+            append_row_major(nn_output[i], doubles);
+        }
+    } break;
+    case TERMINAL_NO_CONSENSUS:
+    case TERMINAL_TOO_MANY_FAILS:
+    default:
+        return -1;
+    }
+    return data_offset;
+}
+
+static void write_int32s(const std::vector<int32_t>& values, std::ostream& out_stream) {
+    out_stream.write(reinterpret_cast<const char*>(values.data()), values.size() * sizeof(int32_t));
+}
+
+void binary_serialize_lookahead(const LookaheadNode* root, const AssignmentProbs& starting_reach_probs, std::ostream& out_stream) {
+    std::vector<const LookaheadNode*> order = { root };
+    std::vector<int32_t> fields;
+    std::vector<double> doubles;
+
+    for (size_t index = 0; index < order.size(); index++) {
+        const LookaheadNode* node = order[index];
+        const int first_child = order.size();
+        for (const auto& child : node->children) {
+            order.push_back(child.get());
+        }
+
+        fields.push_back(node->type);
+        fields.push_back(node->num_succeeds);
+        fields.push_back(node->num_fails);
+        fields.push_back(node->proposer);
+        fields.push_back(node->propose_count);
+        fields.push_back(node->proposal);
+        fields.push_back((node->type == PROPOSE) ? ROUND_TO_PROPOSE_SIZE[node->round()] : 0);
+        fields.push_back(first_child);
+        fields.push_back(node->children.size());
+        fields.push_back(append_node_data(node, starting_reach_probs, &doubles));
+    }
+
+    std::vector<int32_t> header = { BINARY_VERSION, (int32_t) order.size(), (int32_t) doubles.size() };
+    std::vector<int32_t> options;
+    for (int i = 0; i < NUM_PROPOSAL_OPTIONS; i++) {
+        options.push_back(INDEX_TO_PROPOSAL_2[i]);
+    }
+    for (int i = 0; i < NUM_PROPOSAL_OPTIONS; i++) {
+        options.push_back(INDEX_TO_PROPOSAL_3[i]);
+    }
+
+    out_stream.write("DRLB", 4);
+    write_int32s(header, out_stream);
+    write_int32s(options, out_stream);
+    write_int32s(fields, out_stream);
+    out_stream.write(reinterpret_cast<const char*>(doubles.data()), doubles.size() * sizeof(double));
+}
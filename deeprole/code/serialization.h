@@ -7,6 +7,7 @@
 
 void json_deserialize_starting_reach_probs(std::istream& in_stream, AssignmentProbs* starting_reach_probs);
 void json_serialize_lookahead(const LookaheadNode* root, const AssignmentProbs& starting_reach_probs, std::ostream& out_stream);
+void binary_serialize_lookahead(const LookaheadNode* root, const AssignmentProbs& starting_reach_probs, std::ostream& out_stream);
 
 template <typename Derived>
 inline std::vector<std::vector<double>> eigen_to_double_vector(const Eigen::ArrayBase<Derived>& array) {